@@ -5,6 +5,12 @@ SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 # 获取项目根目录（脚本目录的上级目录）
 PROJECT_DIR="$(dirname "$SCRIPT_DIR")"
 
+# 导入配置文件
+source "$SCRIPT_DIR/config.sh"
+
+# 从环境变量获取默认环境，如果没有设置则默认为生产环境
+ENVIRONMENT="${TOOLS_WANGQY_TOP_BACKEND_ENV:-prd}"
+
 # 日志文件路径
 LOG_FILE="$PROJECT_DIR/logs/django.log"
 
@@ -20,7 +26,7 @@ show_help() {
     echo "  tail -n N  - 查看最后N行日志"
     echo "  rotate     - 手动执行日志轮转"
     echo "  clean      - 清理所有日志文件"
-    echo "  stats      - 显示日志统计信息"
+    echo "  stats      - 显示日志统计信息（增量统计所有日志，--reset 重新统计）"
     echo "  help       - 显示此帮助信息"
     echo ""
     echo "示例:"
@@ -91,27 +97,20 @@ tail_log() {
     fi
 }
 
-# 显示日志统计信息
+# 显示日志统计信息（包含轮转日志和excel_tools.log，基于检查点增量统计）
 show_stats() {
-    echo "📈 日志统计信息"
-    echo "=================="
+    local python_cmd=$(get_python_cmd "$ENVIRONMENT")
+    local settings_module=$(get_settings_module "$ENVIRONMENT")
 
-    if [ -f "$LOG_FILE" ]; then
-        echo "主日志文件统计:"
-        echo "  - 总行数: $(wc -l <"$LOG_FILE")"
-        echo "  - 文件大小: $(du -h "$LOG_FILE" | cut -f1)"
-        echo "  - 错误数量: $(grep -i "error\|exception\|traceback" "$LOG_FILE" | wc -l)"
-        echo "  - 警告数量: $(grep -i "warning" "$LOG_FILE" | wc -l)"
-        echo "  - 请求数量: $(grep -i "GET\|POST\|PUT\|DELETE" "$LOG_FILE" | wc -l)"
-
-        echo ""
-        echo "最近24小时活动:"
-        local yesterday=$(date -v-1d +"%Y-%m-%d" 2>/dev/null || date -d "1 day ago" +"%Y-%m-%d" 2>/dev/null)
-        echo "  - 今日日志行数: $(grep "$(date +%Y-%m-%d)" "$LOG_FILE" | wc -l)"
-        echo "  - 昨日日志行数: $(grep "$yesterday" "$LOG_FILE" | wc -l)"
-    else
-        echo "日志文件不存在"
+    if [ ! -d "$PROJECT_DIR/logs" ]; then
+        echo "日志目录不存在: $PROJECT_DIR/logs"
+        return
     fi
+
+    (
+        cd "$PROJECT_DIR/src" &&
+            DJANGO_SETTINGS_MODULE="$settings_module" $python_cmd manage.py log_stats "$@"
+    )
 }
 
 # 清理所有日志文件
@@ -149,6 +148,12 @@ clean_logs() {
             echo "✅ 已删除日志轮转脚本日志"
         fi
 
+        # 删除日志统计检查点
+        if [ -f "$PROJECT_DIR/logs/.log_stats_checkpoint.json" ]; then
+            rm "$PROJECT_DIR/logs/.log_stats_checkpoint.json"
+            echo "✅ 已删除日志统计检查点"
+        fi
+
         echo "✅ 所有日志文件已清理"
     else
         echo "❌ 操作已取消"
@@ -176,7 +181,8 @@ case "${1:-help}" in
     clean_logs
     ;;
 "stats")
-    show_stats
+    shift
+    show_stats "$@"
     ;;
 "help" | *)
     show_help
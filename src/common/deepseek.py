@@ -9,12 +9,523 @@
 """
 
 import os
+import math
+import time
 import logging
+import itertools
+import threading
+import contextvars
 import requests
-from typing import Optional, Dict, Any
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Hashable, List
 
 logger = logging.getLogger(__name__)
 
+# 当前调用所属的作业 (key, size)，未设置时每次调用视为一个独立的小作业
+_current_job = contextvars.ContextVar("deepseek_job", default=None)
+_job_keys = itertools.count(1)
+
+
+@contextmanager
+def scheduler_job(key: Optional[Hashable] = None, size: int = 1):
+    """
+    声明后续DeepSeek调用所属的作业，用于调度器公平排队
+
+    同一个key的调用共享一个队列，不同作业之间轮转调度，size不超过
+    small_job_size的作业优先。在线程池中执行的调用需要在各自线程内
+    使用相同的key再次声明。
+
+    Args:
+        key: 作业标识，为None时自动生成
+        size: 作业规模（例如待处理的行数）
+    """
+    if key is None:
+        key = f"job-{next(_job_keys)}"
+    token = _current_job.set((key, size))
+    try:
+        yield key
+    finally:
+        _current_job.reset(token)
+
+
+class _Ticket:
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+
+class DeepSeekScheduler:
+    """进程级DeepSeek调用调度器：全局并发/速率上限、作业间轮转、小作业优先"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_requests_per_minute: int = 0,
+        small_job_size: int = 50,
+        max_small_burst: int = 4,
+    ):
+        """
+        初始化调度器
+
+        Args:
+            max_concurrency: 全局最大并发调用数
+            max_requests_per_minute: 每分钟最多发起的调用数，0表示不限制
+            small_job_size: 规模不超过该值的作业视为小作业，优先调度
+            max_small_burst: 有大作业等待时，最多连续调度的小作业调用数，防止大作业饿死
+        """
+        self.max_concurrency = max_concurrency
+        self.max_requests_per_minute = max_requests_per_minute
+        self.small_job_size = small_job_size
+        self.max_small_burst = max_small_burst
+
+        self._cond = threading.Condition()
+        self._active = 0
+        # key -> [size, deque[_Ticket]]，按轮转顺序排列
+        self._waiting = OrderedDict()
+        self._starts = deque()
+        self._small_burst = 0
+
+    @contextmanager
+    def slot(self):
+        """
+        获取一个调用名额，退出上下文时释放
+        """
+        job = _current_job.get()
+        if job is None:
+            key, size = f"job-{next(_job_keys)}", 1
+        else:
+            key, size = job
+
+        ticket = _Ticket()
+        enqueued_at = time.monotonic()
+        with self._cond:
+            if key not in self._waiting:
+                self._waiting[key] = [size, deque()]
+            self._waiting[key][1].append(ticket)
+            try:
+                while not ticket.granted:
+                    delay = self._dispatch()
+                    if not ticket.granted:
+                        self._cond.wait(timeout=delay)
+            except BaseException:
+                if ticket.granted:
+                    self._release()
+                else:
+                    self._discard(key, ticket)
+                raise
+
+        waited = time.monotonic() - enqueued_at
+        if waited > 1:
+            logger.info(f"DeepSeek调用排队 {waited:.2f} 秒，作业: {key}")
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._release()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        当前调度状态
+
+        Returns:
+            {"active": 正在进行的调用数, "waiting": 排队中的调用数}
+        """
+        with self._cond:
+            waiting = sum(len(tickets) for _, tickets in self._waiting.values())
+            return {"active": self._active, "waiting": waiting}
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+        self._cond.notify_all()
+
+    def _discard(self, key, ticket):
+        entry = self._waiting.get(key)
+        if entry is not None:
+            entry[1].remove(ticket)
+            if not entry[1]:
+                del self._waiting[key]
+
+    def _next_job(self):
+        small = large = None
+        for key, (size, _) in self._waiting.items():
+            if size <= self.small_job_size:
+                if small is None:
+                    small = key
+            elif large is None:
+                large = key
+            if small is not None and large is not None:
+                break
+
+        if small is None or (
+            large is not None and self._small_burst >= self.max_small_burst
+        ):
+            self._small_burst = 0
+            return large
+        self._small_burst += 1
+        return small
+
+    def _dispatch(self) -> Optional[float]:
+        """
+        在持有锁时分配空闲名额
+
+        Returns:
+            受速率限制时距离下一个可用名额的秒数，否则为None
+        """
+        now = time.monotonic()
+        while self._starts and now - self._starts[0] >= 60:
+            self._starts.popleft()
+
+        granted = False
+        while self._waiting and self._active < self.max_concurrency:
+            if (
+                self.max_requests_per_minute
+                and len(self._starts) >= self.max_requests_per_minute
+            ):
+                if granted:
+                    self._cond.notify_all()
+                return 60 - (now - self._starts[0])
+
+            key = self._next_job()
+            tickets = self._waiting[key][1]
+            tickets.popleft().granted = True
+            if tickets:
+                self._waiting.move_to_end(key)
+            else:
+                del self._waiting[key]
+
+            self._active += 1
+            self._starts.append(now)
+            granted = True
+
+        if granted:
+            self._cond.notify_all()
+        return None
+
+
+class _KeyState:
+    """单个API密钥的限流状态和用量"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.in_flight = 0
+        self.starts = deque()
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @property
+    def label(self) -> str:
+        return f"{self.key[:3]}...{self.key[-4:]}"
+
+
+class DeepSeekKeyPool:
+    """DeepSeek API密钥池：按剩余额度选择密钥，收到429的密钥进入冷却"""
+
+    def __init__(
+        self,
+        keys: List[str],
+        max_requests_per_minute: int = 0,
+        cooldown_seconds: float = 30.0,
+    ):
+        """
+        初始化密钥池
+
+        Args:
+            keys: API密钥列表
+            max_requests_per_minute: 每个密钥每分钟最多调用数，0表示不限制
+            cooldown_seconds: 收到429且响应没有Retry-After时的冷却秒数
+        """
+        self.max_requests_per_minute = max_requests_per_minute
+        self.cooldown_seconds = cooldown_seconds
+        self._keys = [_KeyState(key) for key in dict.fromkeys(keys) if key]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _headroom(self, state, now) -> tuple:
+        while state.starts and now - state.starts[0] >= 60:
+            state.starts.popleft()
+        if self.max_requests_per_minute:
+            remaining = self.max_requests_per_minute - len(state.starts)
+        else:
+            remaining = 0
+        # 先比较本分钟剩余额度，再比较进行中的调用数和最近一次使用时间
+        last_used = state.starts[-1] if state.starts else 0.0
+        return (remaining, -state.in_flight, -last_used)
+
+    def try_acquire(self) -> tuple:
+        """
+        选择剩余额度最多的密钥，不等待
+
+        Returns:
+            (选中的密钥状态, None)；所有密钥都在冷却或额度用尽时为
+            (None, 距离下一个密钥可用的秒数)
+        """
+        with self._lock:
+            now = time.monotonic()
+            available = [state for state in self._keys if state.cooldown_until <= now]
+            if available:
+                state = max(available, key=lambda k: self._headroom(k, now))
+                if (
+                    not self.max_requests_per_minute
+                    or len(state.starts) < self.max_requests_per_minute
+                ):
+                    state.in_flight += 1
+                    state.requests += 1
+                    state.starts.append(now)
+                    return state, None
+                return None, 60 - (now - state.starts[0])
+            return None, min(state.cooldown_until for state in self._keys) - now
+
+    def acquire(self) -> _KeyState:
+        """
+        选择剩余额度最多的密钥，所有密钥都在冷却或额度用尽时等待
+
+        Returns:
+            选中的密钥状态，调用结束后需要调用release
+        """
+        while True:
+            state, delay = self.try_acquire()
+            if state is not None:
+                return state
+            logger.warning(f"DeepSeek密钥均不可用，等待 {delay:.1f} 秒")
+            time.sleep(max(delay, 0.1))
+
+    def release(
+        self,
+        state: _KeyState,
+        status_code: Optional[int] = None,
+        retry_after: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        记录调用结果并释放密钥
+
+        Args:
+            state: acquire返回的密钥状态
+            status_code: HTTP状态码，请求未完成时为None
+            retry_after: 429响应的Retry-After头
+            usage: 响应中的token用量
+        """
+        with self._lock:
+            state.in_flight -= 1
+            if status_code == 429:
+                state.rate_limited += 1
+                try:
+                    cooldown = float(retry_after)
+                except (TypeError, ValueError):
+                    cooldown = self.cooldown_seconds
+                state.cooldown_until = time.monotonic() + cooldown
+                logger.warning(f"DeepSeek密钥 {state.label} 被限流，冷却 {cooldown} 秒")
+            elif status_code is not None and status_code < 400:
+                state.successes += 1
+            else:
+                state.errors += 1
+
+            if usage:
+                state.prompt_tokens += usage.get("prompt_tokens", 0)
+                state.completion_tokens += usage.get("completion_tokens", 0)
+
+    def usage(self) -> List[Dict[str, Any]]:
+        """
+        每个密钥的用量统计（密钥已脱敏）
+
+        Returns:
+            用量字典列表
+        """
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    "key": state.label,
+                    "requests": state.requests,
+                    "successes": state.successes,
+                    "rate_limited": state.rate_limited,
+                    "errors": state.errors,
+                    "in_flight": state.in_flight,
+                    "requests_last_minute": sum(
+                        1 for start in state.starts if now - start < 60
+                    ),
+                    "cooldown_seconds": round(max(state.cooldown_until - now, 0), 1),
+                    "prompt_tokens": state.prompt_tokens,
+                    "completion_tokens": state.completion_tokens,
+                }
+                for state in self._keys
+            ]
+
+
+_key_pool = None
+_key_pool_lock = threading.Lock()
+
+
+def get_key_pool() -> DeepSeekKeyPool:
+    """
+    获取进程级密钥池，首次调用时根据环境变量创建
+
+    环境变量:
+        DEEPSEEK_API_KEYS: 多个API密钥，用逗号分隔
+        DEEPSEEK_API_KEY: 单个API密钥，与DEEPSEEK_API_KEYS合并
+        DEEPSEEK_MAX_REQUESTS_PER_MINUTE: 每个密钥每分钟最多调用数，默认0（不限制）
+        DEEPSEEK_KEY_COOLDOWN_SECONDS: 密钥被限流后的默认冷却秒数，默认30
+
+    Returns:
+        DeepSeekKeyPool实例
+    """
+    global _key_pool
+    with _key_pool_lock:
+        if _key_pool is None:
+            keys = [
+                key.strip()
+                for key in os.getenv("DEEPSEEK_API_KEYS", "").split(",")
+                if key.strip()
+            ]
+            keys.append(os.getenv("DEEPSEEK_API_KEY", "").strip())
+            _key_pool = DeepSeekKeyPool(
+                keys,
+                max_requests_per_minute=int(
+                    os.getenv("DEEPSEEK_MAX_REQUESTS_PER_MINUTE", "0")
+                ),
+                cooldown_seconds=float(
+                    os.getenv("DEEPSEEK_KEY_COOLDOWN_SECONDS", "30")
+                ),
+            )
+        return _key_pool
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> DeepSeekScheduler:
+    """
+    获取进程级调度器，首次调用时根据环境变量创建
+
+    并发和速率上限按密钥池中的密钥数放大，增加密钥即可提高整体吞吐。
+
+    环境变量:
+        DEEPSEEK_MAX_CONCURRENCY: 每个密钥的最大并发调用数，默认4
+        DEEPSEEK_MAX_REQUESTS_PER_MINUTE: 每个密钥每分钟最多调用数，默认0（不限制）
+        DEEPSEEK_SMALL_JOB_SIZE: 小作业规模上限，默认50
+
+    Returns:
+        DeepSeekScheduler实例
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            key_count = max(len(get_key_pool()), 1)
+            _scheduler = DeepSeekScheduler(
+                max_concurrency=int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "4"))
+                * key_count,
+                max_requests_per_minute=int(
+                    os.getenv("DEEPSEEK_MAX_REQUESTS_PER_MINUTE", "0")
+                )
+                * key_count,
+                small_job_size=int(os.getenv("DEEPSEEK_SMALL_JOB_SIZE", "50")),
+            )
+        return _scheduler
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的token数
+
+    按DeepSeek文档给出的换算比例：1个中文字符约0.6个token，
+    1个英文字符约0.3个token。
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的token数
+    """
+    cjk = sum(1 for char in text if "\u4e00" <= char <= "\u9fff")
+    return math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+
+class CallHistory:
+    """最近DeepSeek调用的耗时和token用量，用于估算延迟"""
+
+    # 没有历史数据时的默认值：固定开销1秒，输出约33 token/秒
+    DEFAULT_BASE_SECONDS = 1.0
+    DEFAULT_SECONDS_PER_TOKEN = 0.03
+
+    def __init__(self, maxlen: int = 100):
+        self._records = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, prompt_tokens: int, completion_tokens: int):
+        """
+        记录一次调用
+
+        Args:
+            seconds: 调用耗时（不含排队时间）
+            prompt_tokens: 输入token数
+            completion_tokens: 输出token数
+        """
+        with self._lock:
+            self._records.append((seconds, prompt_tokens, completion_tokens))
+
+    def records(self) -> List[tuple]:
+        with self._lock:
+            return list(self._records)
+
+    def estimate_latency(self, completion_tokens: int) -> float:
+        """
+        根据最近的调用记录估算一次调用的耗时
+
+        对历史记录按 耗时 = 固定开销 + 每token耗时 × 输出token数 做最小二乘拟合，
+        记录不足或拟合结果不合理时退回默认值。
+
+        Args:
+            completion_tokens: 预计输出token数
+
+        Returns:
+            估算的秒数
+        """
+        base = self.DEFAULT_BASE_SECONDS
+        per_token = self.DEFAULT_SECONDS_PER_TOKEN
+
+        records = self.records()
+        if records:
+            n = len(records)
+            mean_x = sum(r[2] for r in records) / n
+            mean_y = sum(r[0] for r in records) / n
+            var_x = sum((r[2] - mean_x) ** 2 for r in records)
+            slope = None
+            if n >= 3 and var_x > 0:
+                slope = sum((r[2] - mean_x) * (r[0] - mean_y) for r in records) / var_x
+            if slope is not None and slope > 0 and mean_y - slope * mean_x >= 0:
+                per_token = slope
+                base = mean_y - slope * mean_x
+            elif mean_x > 0:
+                base = min(base, mean_y)
+                per_token = max(mean_y - base, 0) / mean_x
+
+        return base + per_token * completion_tokens
+
+
+_call_history = CallHistory()
+
+
+def get_call_history() -> CallHistory:
+    """
+    获取进程级的调用记录
+
+    Returns:
+        CallHistory实例
+    """
+    return _call_history
+
 
 class DeepSeekClient:
     """DeepSeek API客户端"""
@@ -26,24 +537,53 @@ class DeepSeekClient:
         初始化DeepSeek客户端
 
         Args:
-            api_key: API密钥，如果为None则从环境变量DEEPSEEK_API_KEY获取
+            api_key: API密钥，如果为None则使用进程级密钥池
+                （环境变量DEEPSEEK_API_KEYS和DEEPSEEK_API_KEY）
             base_url: API基础URL
         """
 
-        self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
-        if not self.api_key:
+        self.api_key = api_key
+        self.key_pool = DeepSeekKeyPool([api_key]) if api_key else get_key_pool()
+        if not len(self.key_pool):
             raise ValueError(
-                "API密钥未提供，请设置DEEPSEEK_API_KEY环境变量或传入api_key参数"
+                "API密钥未提供，请设置DEEPSEEK_API_KEY(S)环境变量或传入api_key参数"
             )
 
         self.base_url = base_url.rstrip("/")
         self.session = requests.Session()
-        self.session.headers.update(
-            {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            }
-        )
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def _post(self, url: str, payload: Dict[str, Any], model: str) -> tuple:
+        """
+        占用调度名额后选择密钥并发送请求
+
+        所有密钥都在冷却或额度用尽时先归还名额再等待，避免等待期间占住
+        全局并发名额，使其他作业无法调度。
+
+        Returns:
+            (密钥状态, 响应, 请求耗时秒数)，调用方需要释放密钥
+        """
+        while True:
+            with get_scheduler().slot():
+                key_state, delay = self.key_pool.try_acquire()
+                if key_state is not None:
+                    logger.info(
+                        f"调用DeepSeek API，模型: {model}，密钥: {key_state.label}"
+                    )
+                    start = time.monotonic()
+                    try:
+                        response = self.session.post(
+                            url,
+                            json=payload,
+                            headers={"Authorization": f"Bearer {key_state.key}"},
+                        )
+                    except requests.exceptions.RequestException:
+                        self.key_pool.release(key_state)
+                        raise
+                    return key_state, response, time.monotonic() - start
+
+            logger.warning(f"DeepSeek密钥均不可用，等待 {delay:.1f} 秒")
+            time.sleep(max(delay, 0.1))
 
     def chat_completion(
         self,
@@ -79,11 +619,32 @@ class DeepSeekClient:
             payload["max_tokens"] = max_tokens
 
         try:
-            logger.info(f"调用DeepSeek API，模型: {model}")
-            response = self.session.post(url, json=payload)
-            response.raise_for_status()
+            # 被限流时换用其他密钥重试，每个密钥最多尝试一次
+            for attempt in range(len(self.key_pool)):
+                key_state, response, seconds = self._post(url, payload, model)
+                if response.status_code != 429:
+                    break
+                self.key_pool.release(
+                    key_state, 429, response.headers.get("Retry-After")
+                )
+                if attempt == len(self.key_pool) - 1:
+                    response.raise_for_status()
+
+            if not response.ok:
+                self.key_pool.release(key_state, response.status_code)
+                response.raise_for_status()
 
-            result = response.json()
+            result = {}
+            try:
+                result = response.json()
+            finally:
+                usage = result.get("usage") or {}
+                self.key_pool.release(key_state, response.status_code, usage=usage)
+            _call_history.record(
+                seconds,
+                usage.get("prompt_tokens", 0),
+                usage.get("completion_tokens", 0),
+            )
             logger.info("DeepSeek API调用成功")
             return result
 
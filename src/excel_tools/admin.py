@@ -1,2 +1,11 @@
+from django.contrib import admin
+
+from .models import ProcessedDescription
 
 # Register your models here.
+
+
+@admin.register(ProcessedDescription)
+class ProcessedDescriptionAdmin(admin.ModelAdmin):
+    list_display = ("fingerprint", "created_at")
+    search_fields = ("fingerprint",)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: benchmarks
+@author: kody
+@create: 2026-10-19 16:40:03
+@desc: excel_tools处理流水线各阶段的耗时与峰值内存基准
+"""
+
+import gc
+import io
+import json
+import logging
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+from .common import (
+    _parse_ai_response,
+    build_excel_info,
+    extract_product_descriptions,
+    read_csv_product_descriptions,
+    read_excel_file,
+    split_product_descriptions,
+)
+
+BASELINE_PATH = Path(__file__).resolve().parent / "benchmark_baseline.json"
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# 耗时或峰值内存低于该值的阶段不做回归判断，避免噪声造成误报
+MIN_COMPARABLE_SECONDS = 0.01
+MIN_COMPARABLE_BYTES = 64 * 1024
+
+STAGES = [
+    "read_csv_product_descriptions",
+    "read_excel_file",
+    "extract_product_descriptions",
+    "split_product_descriptions",
+    "_parse_ai_response",
+    "build_excel_info",
+]
+
+# 与上传模板一致：前16行为表头信息，产品描述在F列
+HEADER_ROWS = 16
+COLUMN_COUNT = 8
+DESCRIPTION_COLUMN = 5
+
+
+def generate_workbook(rows, file_format="xlsx"):
+    """
+    生成与上传模板布局一致的合成工作簿
+
+    Args:
+        rows: 产品描述行数
+        file_format: 文件格式，支持xlsx、csv和tsv
+
+    Returns:
+        io.BytesIO: 工作簿内容
+    """
+    if file_format not in ("xlsx", "csv", "tsv"):
+        raise ValueError(f"不支持的格式: {file_format}")
+
+    data = [[None] * COLUMN_COUNT for _ in range(HEADER_ROWS)]
+    data[0][0] = "Quotation"
+    for i in range(rows):
+        row = [f"C{c}-{i}" for c in range(COLUMN_COUNT)]
+        row[DESCRIPTION_COLUMN] = (
+            f"Model X{i % 500} | Stainless steel | {i % 7 + 1}mm | "
+            f"Grade A | Stainless steel | Batch {i}"
+        )
+        data.append(row)
+
+    data_frame = pd.DataFrame(data, columns=[f"col{c}" for c in range(COLUMN_COUNT)])
+    if file_format == "xlsx":
+        buffer = io.BytesIO()
+        data_frame.to_excel(buffer, index=False)
+    else:
+        sep = "," if file_format == "csv" else "\t"
+        buffer = io.BytesIO(data_frame.to_csv(sep=sep, index=False).encode("utf-8"))
+    buffer.seek(0)
+    return buffer
+
+
+def _fake_ai_response(product_descriptions_split):
+    lines = [" | ".join(items) for items in product_descriptions_split]
+    return "```\n" + "\n".join(lines) + "\n```"
+
+
+def _measure(func, repeat):
+    """
+    测量函数的最短耗时和峰值内存
+
+    耗时在未开启tracemalloc时测量（取repeat次中的最小值），峰值内存单独
+    测量一次，避免tracemalloc的开销影响计时。
+
+    Args:
+        func: 无参数的可调用对象
+        repeat: 计时重复次数
+
+    Returns:
+        tuple: (result, seconds, peak_bytes)
+    """
+    seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if seconds is None or elapsed < seconds:
+            seconds = elapsed
+
+    # 先回收之前阶段遗留的垃圾，避免回收时机影响峰值内存
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return result, round(seconds, 6), peak_bytes
+
+
+def run_benchmark(rows, repeat=3, workbook=None, csv_workbook=None):
+    """
+    对指定行数的合成工作簿运行各阶段基准
+
+    Args:
+        rows: 产品描述行数
+        repeat: 每个阶段的计时重复次数
+        workbook: 预先生成的xlsx工作簿，为None时自动生成
+        csv_workbook: 相同数据的CSV文件，为None时自动生成
+
+    Returns:
+        dict: {阶段名: {"seconds": float, "peak_bytes": int}}
+    """
+    if workbook is None:
+        workbook = generate_workbook(rows)
+    if csv_workbook is None:
+        csv_workbook = generate_workbook(rows, file_format="csv")
+    results = {}
+
+    # 各阶段会把完整数据写入INFO日志，基准只测量处理本身
+    logging.disable(logging.INFO)
+    try:
+        _, seconds, peak = _measure(
+            lambda: read_csv_product_descriptions(csv_workbook), repeat
+        )
+        results["read_csv_product_descriptions"] = {
+            "seconds": seconds,
+            "peak_bytes": peak,
+        }
+
+        excel_data, seconds, peak = _measure(lambda: read_excel_file(workbook), repeat)
+        results["read_excel_file"] = {"seconds": seconds, "peak_bytes": peak}
+
+        descriptions, seconds, peak = _measure(
+            lambda: extract_product_descriptions(excel_data), repeat
+        )
+        results["extract_product_descriptions"] = {
+            "seconds": seconds,
+            "peak_bytes": peak,
+        }
+
+        descriptions_split, seconds, peak = _measure(
+            lambda: split_product_descriptions(descriptions), repeat
+        )
+        results["split_product_descriptions"] = {
+            "seconds": seconds,
+            "peak_bytes": peak,
+        }
+
+        ai_response = _fake_ai_response(descriptions_split)
+        processed, seconds, peak = _measure(
+            lambda: _parse_ai_response(ai_response), repeat
+        )
+        results["_parse_ai_response"] = {"seconds": seconds, "peak_bytes": peak}
+
+        # 与上传视图一致，传入重新计算的行下标（首次上传时为全部行）
+        recomputed = list(range(len(descriptions_split)))
+        _, seconds, peak = _measure(
+            lambda: build_excel_info(
+                excel_data.shape, descriptions_split, processed, recomputed
+            ),
+            repeat,
+        )
+        results["build_excel_info"] = {"seconds": seconds, "peak_bytes": peak}
+    finally:
+        logging.disable(logging.NOTSET)
+
+    return results
+
+
+def input_throughput(results, rows):
+    """
+    计算读取并提取产品描述的吞吐量（行/秒）
+
+    Args:
+        results: run_benchmark的结果
+        rows: 产品描述行数
+
+    Returns:
+        dict: {"xlsx": 行/秒, "csv": 行/秒}
+    """
+    xlsx_seconds = (
+        results["read_excel_file"]["seconds"]
+        + results["extract_product_descriptions"]["seconds"]
+    )
+    csv_seconds = results["read_csv_product_descriptions"]["seconds"]
+    return {
+        "xlsx": rows / xlsx_seconds if xlsx_seconds else float("inf"),
+        "csv": rows / csv_seconds if csv_seconds else float("inf"),
+    }
+
+
+def load_baseline(path=BASELINE_PATH):
+    """
+    读取基准数据
+
+    Args:
+        path: 基准文件路径
+
+    Returns:
+        dict: {行数字符串: {阶段名: 指标}}，文件不存在时返回空字典
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(baseline, path=BASELINE_PATH):
+    """
+    保存基准数据
+
+    Args:
+        baseline: 基准数据
+        path: 基准文件路径
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def find_regressions(results, baseline, time_threshold, memory_threshold):
+    """
+    对比基准，找出超过阈值的回归
+
+    Args:
+        results: run_benchmark的结果
+        baseline: 同一行数的基准数据
+        time_threshold: 允许的耗时增长比例，例如0.5表示最多慢50%
+        memory_threshold: 允许的峰值内存增长比例
+
+    Returns:
+        list: 回归描述列表
+    """
+    regressions = []
+    for stage, metrics in results.items():
+        expected = baseline.get(stage)
+        if not expected:
+            continue
+
+        if metrics["seconds"] >= MIN_COMPARABLE_SECONDS and metrics[
+            "seconds"
+        ] > expected["seconds"] * (1 + time_threshold):
+            regressions.append(
+                "%s 耗时 %.4fs，基准 %.4fs"
+                % (stage, metrics["seconds"], expected["seconds"])
+            )
+
+        if metrics["peak_bytes"] >= MIN_COMPARABLE_BYTES and metrics[
+            "peak_bytes"
+        ] > expected["peak_bytes"] * (1 + memory_threshold):
+            regressions.append(
+                "%s 峰值内存 %d bytes，基准 %d bytes"
+                % (stage, metrics["peak_bytes"], expected["peak_bytes"])
+            )
+    return regressions
@@ -1,11 +1,50 @@
+import codecs
+import csv
+import hashlib
+import io
+import json
 import logging
+import math
 import os
 import pandas as pd
-from common.deepseek import generate_text
+from openpyxl import load_workbook
+from common.deepseek import (
+    estimate_tokens,
+    generate_text,
+    get_call_history,
+    get_scheduler,
+    scheduler_job,
+)
 
 # 获取excel_tools应用的logger
 logger = logging.getLogger("excel_tools")
 
+# 文本表格的扩展名及分隔符
+CSV_DELIMITERS = {".csv": ",", ".tsv": "\t"}
+
+# 编码检测读取的字节数
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+# 产品描述位于F列，从第18行（表头之后的第17条数据）开始
+DESCRIPTION_COLUMN_INDEX = 5
+DESCRIPTION_FIRST_DATA_ROW = 16
+
+# AI调用参数，使用较低的温度以获得更稳定的结果
+AI_MODEL = "deepseek-chat"
+AI_TEMPERATURE = 0.3
+
+# 单次AI调用的最大输出token数
+AI_MAX_TOKENS = 2000
+
+# 按指纹查询已保存结果时每条SQL的指纹数，低于旧版SQLite默认的999个参数上限
+FINGERPRINT_QUERY_CHUNK_SIZE = 500
+
+# 结果解析等处理逻辑变化时递增，使之前保存的行结果不再复用
+FINGERPRINT_VERSION = 1
+
+# 预估输出token数时，输出相对原始数据的比例（清洗后通常比原始数据短）
+COMPLETION_TOKEN_RATIO = 0.8
+
 
 def validate_file_upload(uploaded_file):
     """
@@ -22,13 +61,13 @@ def validate_file_upload(uploaded_file):
         logger.warning("文件大小超过限制: %s bytes", uploaded_file.size)
         return False, "文件大小不能超过10MB"
 
-    # 检查文件类型（只允许Excel文件）
-    allowed_extensions = [".xlsx", ".xls"]
+    # 检查文件类型（只允许Excel和CSV/TSV文件）
+    allowed_extensions = [".xlsx", ".xls", *CSV_DELIMITERS]
     file_extension = os.path.splitext(uploaded_file.name)[1].lower()
 
     if file_extension not in allowed_extensions:
         logger.warning("不支持的文件类型: %s", file_extension)
-        return False, "只支持Excel文件格式(.xlsx, .xls)"
+        return False, "只支持Excel或CSV文件格式(.xlsx, .xls, .csv, .tsv)"
 
     return True, None
 
@@ -61,7 +100,11 @@ def extract_product_descriptions(excel_data):
     """
     try:
         # 读取F列从第17行开始的所有数据（排除17F）
-        product_descriptions = excel_data.iloc[16:, 5].dropna().tolist()
+        product_descriptions = (
+            excel_data.iloc[DESCRIPTION_FIRST_DATA_ROW:, DESCRIPTION_COLUMN_INDEX]
+            .dropna()
+            .tolist()
+        )
         logger.info(
             "从17F单元格以下读取到Product Description数据，共%d条记录",
             len(product_descriptions),
@@ -73,6 +116,224 @@ def extract_product_descriptions(excel_data):
         raise ValueError("无法读取17F单元格以下的Product Description数据")
 
 
+def detect_encodings(uploaded_file):
+    """
+    根据文件开头的样本推测文本文件可能的编码
+
+    依次检查BOM、尝试UTF-8和GB18030（中文Windows下Excel导出CSV的默认编码），
+    最后加入charset_normalizer（requests的依赖）的判断结果。样本只覆盖文件
+    开头（例如开头全是ASCII时UTF-8和GB18030都能解码），因此返回全部候选，
+    由调用方严格解码并在失败时换用下一个。
+
+    Args:
+        uploaded_file: 上传的文件对象
+
+    Returns:
+        list: 按优先级排列的候选编码
+    """
+    uploaded_file.seek(0)
+    sample = uploaded_file.read(ENCODING_SAMPLE_SIZE)
+    uploaded_file.seek(0)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        return ["utf-8-sig"]
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return ["utf-16"]
+
+    encodings = []
+    for encoding in ("utf-8", "gb18030"):
+        try:
+            # 样本末尾可能截断多字节字符，使用增量解码器忽略不完整的结尾
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            encodings.append(encoding)
+        except UnicodeDecodeError:
+            pass
+
+    try:
+        from charset_normalizer import from_bytes
+    except ImportError:
+        from_bytes = None
+
+    if from_bytes is not None:
+        best = from_bytes(sample).best()
+        if best is not None and codecs.lookup(best.encoding).name not in {
+            codecs.lookup(encoding).name for encoding in encodings
+        }:
+            encodings.append(best.encoding)
+
+    return encodings
+
+
+def _read_csv_rows(uploaded_file, encoding, delimiter):
+    uploaded_file.seek(0)
+    # 严格解码，编码判断错误时抛出UnicodeDecodeError而不是替换字符
+    text_file = io.TextIOWrapper(uploaded_file, encoding=encoding, newline="")
+    product_descriptions = []
+    total_rows = -1
+    total_columns = 0
+    try:
+        for total_rows, row in enumerate(csv.reader(text_file, delimiter=delimiter)):
+            if len(row) > total_columns:
+                total_columns = len(row)
+            # 第0行为表头，数据行从1开始计数
+            if (
+                total_rows > DESCRIPTION_FIRST_DATA_ROW
+                and len(row) > DESCRIPTION_COLUMN_INDEX
+            ):
+                description = row[DESCRIPTION_COLUMN_INDEX]
+                if description:
+                    product_descriptions.append(description)
+    finally:
+        # 避免关闭包装器时同时关闭上传的文件
+        text_file.detach()
+    return product_descriptions, (max(total_rows, 0), total_columns)
+
+
+def read_csv_product_descriptions(uploaded_file, delimiter=","):
+    """
+    流式读取CSV/TSV文件，只提取F列的产品描述
+
+    布局与Excel一致：第1行为表头，产品描述在F列第17行以下（排除17F）。
+    按候选编码依次严格解码，文件中途解码失败时从头用下一个编码重读。
+
+    Args:
+        uploaded_file: 上传的文件对象
+        delimiter: 字段分隔符
+
+    Returns:
+        tuple: (产品描述列表, (数据行数, 列数))
+    """
+    for encoding in detect_encodings(uploaded_file):
+        try:
+            product_descriptions, excel_shape = _read_csv_rows(
+                uploaded_file, encoding, delimiter
+            )
+            break
+        except UnicodeDecodeError as e:
+            logger.warning("CSV文件按%s解码失败，尝试下一个编码: %s", encoding, str(e))
+        except csv.Error as e:
+            logger.error("CSV文件解析失败: %s", str(e))
+            raise ValueError(f"CSV文件解析失败: {e}")
+    else:
+        logger.error("无法识别CSV文件编码")
+        raise ValueError("无法识别CSV文件编码，请另存为UTF-8编码后重新上传")
+
+    if excel_shape[1] <= DESCRIPTION_COLUMN_INDEX:
+        logger.error("无法读取17F单元格以下的数据")
+        raise ValueError("无法读取17F单元格以下的Product Description数据")
+
+    logger.info("CSV文件读取成功，编码: %s，数据形状: %s", encoding, excel_shape)
+    logger.info(
+        "从17F单元格以下读取到Product Description数据，共%d条记录",
+        len(product_descriptions),
+    )
+    logger.info("Product Description数据: %s", product_descriptions)
+    return product_descriptions, excel_shape
+
+
+def read_product_descriptions(uploaded_file):
+    """
+    根据文件扩展名读取产品描述，CSV/TSV走流式解析，其余按Excel读取
+
+    Args:
+        uploaded_file: 上传的文件对象
+
+    Returns:
+        tuple: (产品描述列表, (数据行数, 列数))
+    """
+    file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+    if file_extension in CSV_DELIMITERS:
+        return read_csv_product_descriptions(
+            uploaded_file, delimiter=CSV_DELIMITERS[file_extension]
+        )
+
+    excel_data = read_excel_file(uploaded_file)
+    return extract_product_descriptions(excel_data), excel_data.shape
+
+
+def _scan_sized_worksheet(worksheet):
+    if worksheet.max_column <= DESCRIPTION_COLUMN_INDEX:
+        return [], (worksheet.max_row - 1, worksheet.max_column)
+
+    # 第1行为表头，F列数据从第18行开始
+    product_descriptions = []
+    for (description,) in worksheet.iter_rows(
+        min_row=DESCRIPTION_FIRST_DATA_ROW + 2,
+        min_col=DESCRIPTION_COLUMN_INDEX + 1,
+        max_col=DESCRIPTION_COLUMN_INDEX + 1,
+        values_only=True,
+    ):
+        if description is not None:
+            product_descriptions.append(description)
+    return product_descriptions, (worksheet.max_row - 1, worksheet.max_column)
+
+
+def _scan_unsized_worksheet(worksheet):
+    product_descriptions = []
+    total_rows = total_columns = 0
+    for total_rows, row in enumerate(worksheet.iter_rows(values_only=True), start=1):
+        if len(row) > total_columns:
+            total_columns = len(row)
+        if (
+            total_rows > DESCRIPTION_FIRST_DATA_ROW + 1
+            and len(row) > DESCRIPTION_COLUMN_INDEX
+            and row[DESCRIPTION_COLUMN_INDEX] is not None
+        ):
+            product_descriptions.append(row[DESCRIPTION_COLUMN_INDEX])
+    return product_descriptions, (max(total_rows - 1, 0), total_columns)
+
+
+def scan_product_descriptions(uploaded_file):
+    """
+    只读取表格尺寸和F列产品描述，用于预估，不构建完整的DataFrame
+
+    xlsx使用openpyxl只读模式逐行读取F列（工作表缺少尺寸记录时读取整行），
+    CSV/TSV使用流式读取，xls没有只读模式，只加载F列。
+
+    Args:
+        uploaded_file: 上传的文件对象
+
+    Returns:
+        tuple: (产品描述列表, (数据行数, 列数))
+    """
+    file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+    if file_extension in CSV_DELIMITERS:
+        return read_csv_product_descriptions(
+            uploaded_file, delimiter=CSV_DELIMITERS[file_extension]
+        )
+
+    uploaded_file.seek(0)
+    if file_extension == ".xls":
+        column = pd.read_excel(uploaded_file, usecols=[DESCRIPTION_COLUMN_INDEX])
+        product_descriptions = (
+            column.iloc[DESCRIPTION_FIRST_DATA_ROW:, 0].dropna().tolist()
+        )
+        return product_descriptions, (len(column), None)
+
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        # 与pandas.read_excel一致，读取第一个工作表
+        worksheet = workbook.worksheets[0]
+        if worksheet.max_column is None or worksheet.max_row is None:
+            # 缺少<dimension>记录的工作表在只读模式下没有尺寸，逐行读取整表一次
+            product_descriptions, excel_shape = _scan_unsized_worksheet(worksheet)
+        else:
+            product_descriptions, excel_shape = _scan_sized_worksheet(worksheet)
+    finally:
+        workbook.close()
+
+    if excel_shape[1] <= DESCRIPTION_COLUMN_INDEX:
+        logger.error("无法读取17F单元格以下的数据")
+        raise ValueError("无法读取17F单元格以下的Product Description数据")
+
+    logger.info(
+        "预估读取到Product Description数据%d条，数据形状: %s",
+        len(product_descriptions),
+        excel_shape,
+    )
+    return product_descriptions, excel_shape
+
+
 def split_product_descriptions(product_descriptions):
     """
     将产品描述按|分割成列表
@@ -95,25 +356,24 @@ def split_product_descriptions(product_descriptions):
     return product_descriptions_split
 
 
-def process_descriptions_with_ai(product_descriptions_split):
+def build_ai_prompt(product_descriptions_split):
     """
-    使用AI处理产品描述数据
+    构建AI处理产品描述的提示词
 
     Args:
         product_descriptions_split: 分割后的产品描述列表
 
     Returns:
-        list: AI处理后的产品描述列表
+        str: 提示词
     """
-    try:
-        # 构建提示词
-        prompt = f"""
+    return f"""
 请分析以下产品描述数据，返回你认为必要的产品描述。
 要求：
 1. 保持原有的格式（用|分隔）
 2. 只返回处理后的结果，不要附带其他说明
 3. 去除重复、冗余或不必要的信息
 4. 保留核心的产品特征和关键信息
+5. 每条原始数据对应输出一行，行数和顺序与原始数据一致
 
 原始数据：
 {product_descriptions_split}
@@ -121,25 +381,233 @@ def process_descriptions_with_ai(product_descriptions_split):
 请直接返回处理后的结果：
 """
 
-        # 调用DeepSeek API
-        processed_result = generate_text(
-            prompt=prompt,
-            model="deepseek-chat",
-            temperature=0.3,  # 使用较低的温度以获得更稳定的结果
-            max_tokens=2000,
+
+def request_ai_processing(product_descriptions_split):
+    """
+    调用AI处理产品描述数据，失败时抛出异常
+
+    Args:
+        product_descriptions_split: 分割后的产品描述列表
+
+    Returns:
+        list: AI处理后的产品描述列表
+    """
+    # 调用DeepSeek API
+    processed_result = generate_text(
+        prompt=build_ai_prompt(product_descriptions_split),
+        model=AI_MODEL,
+        temperature=AI_TEMPERATURE,
+        max_tokens=AI_MAX_TOKENS,
+    )
+
+    # 解析返回的结果
+    return _parse_ai_response(processed_result)
+
+
+def fingerprint_description(description_items):
+    """
+    计算分割后的单条产品描述的指纹
+
+    指纹包含FINGERPRINT_VERSION、模型、调用参数和提示词模板，其中任意一项
+    变化后旧的处理结果不再复用。
+
+    Args:
+        description_items: 单条产品描述分割后的列表
+
+    Returns:
+        str: sha256指纹
+    """
+    content = json.dumps(
+        [
+            FINGERPRINT_VERSION,
+            AI_MODEL,
+            AI_TEMPERATURE,
+            AI_MAX_TOKENS,
+            build_ai_prompt(""),
+            description_items,
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def lookup_processed_descriptions(product_descriptions_split):
+    """
+    计算每行指纹并分批查询已保存的AI处理结果
+
+    Args:
+        product_descriptions_split: 分割后的产品描述列表
+
+    Returns:
+        tuple: (每行的指纹列表, {指纹: 已保存的结果},
+                {未命中的指纹: 首次出现的行下标})
+    """
+    # 延迟导入，避免解析子进程在未初始化Django时加载模型
+    from .models import ProcessedDescription
+
+    fingerprints = [
+        fingerprint_description(items) for items in product_descriptions_split
+    ]
+    unique_fingerprints = list(dict.fromkeys(fingerprints))
+    cached = {}
+    for start in range(0, len(unique_fingerprints), FINGERPRINT_QUERY_CHUNK_SIZE):
+        cached.update(
+            ProcessedDescription.objects.filter(
+                fingerprint__in=unique_fingerprints[
+                    start : start + FINGERPRINT_QUERY_CHUNK_SIZE
+                ]
+            ).values_list("fingerprint", "result")
         )
 
-        # 解析返回的结果
-        processed_result = _parse_ai_response(processed_result)
+    # 同一次上传中重复的行只处理一次
+    pending = {}
+    for i, fp in enumerate(fingerprints):
+        if fp not in cached:
+            pending.setdefault(fp, i)
+    return fingerprints, cached, pending
+
+
+def process_descriptions_incrementally(product_descriptions_split):
+    """
+    按行指纹增量处理产品描述：已处理过的行直接复用结果，只把新增或
+    修改过的行发送给AI
+
+    Args:
+        product_descriptions_split: 分割后的产品描述列表
+
+    Returns:
+        tuple: (AI处理后的产品描述列表, 重新计算的行下标列表)
+    """
+    from .models import ProcessedDescription
+
+    fingerprints, cached, pending = lookup_processed_descriptions(
+        product_descriptions_split
+    )
+    recomputed = [i for i, fp in enumerate(fingerprints) if fp not in cached]
+
+    logger.info(
+        "产品描述共%d条，复用%d条，需要AI处理%d条",
+        len(product_descriptions_split),
+        len(product_descriptions_split) - len(recomputed),
+        len(pending),
+    )
+
+    results = dict(cached)
+    if pending:
+        pending_rows = [product_descriptions_split[i] for i in pending.values()]
+        try:
+            with scheduler_job(size=len(pending_rows)):
+                processed_rows = request_ai_processing(pending_rows)
+        except Exception as e:
+            logger.error("DeepSeek处理产品描述失败: %s", str(e))
+            logger.info("使用原始产品描述数据")
+            processed_rows = None
+
+        if processed_rows is not None and len(processed_rows) != len(pending_rows):
+            # 返回行数与输入不一致时无法对应到具体的行，与调用失败一样使用
+            # 原始数据，保证结果与产品描述逐行对应，且不缓存
+            logger.warning(
+                "DeepSeek返回%d行，与输入的%d行不一致，使用原始产品描述数据",
+                len(processed_rows),
+                len(pending_rows),
+            )
+            processed_rows = None
+
+        if processed_rows is None:
+            results.update(zip(pending, pending_rows))
+        else:
+            new_results = dict(zip(pending, processed_rows))
+            ProcessedDescription.objects.bulk_create(
+                [
+                    ProcessedDescription(fingerprint=fp, result=result)
+                    for fp, result in new_results.items()
+                ],
+                ignore_conflicts=True,
+            )
+            results.update(new_results)
+
+    processed_descriptions = [results[fp] for fp in fingerprints]
+
+    logger.info("DeepSeek处理后的产品描述: %s", processed_descriptions)
+    return processed_descriptions, recomputed
+
+
+def estimate_processing(product_descriptions, excel_shape, batch_size=None):
+    """
+    在不调用AI的情况下预估处理规模和耗时
+
+    只统计需要发送给AI的行（未命中行指纹缓存且去重后），按
+    build_ai_prompt构建的提示词估算token数，耗时根据最近的调用记录估算。
+
+    Args:
+        product_descriptions: 产品描述列表
+        excel_shape: 表格的(数据行数, 列数)
+        batch_size: 每次AI调用处理的条数，为None时与上传接口一致，一次调用处理全部
+
+    Returns:
+        dict: 预估信息
+    """
+    product_descriptions_split = split_product_descriptions(product_descriptions)
+    fingerprints, _, pending = lookup_processed_descriptions(product_descriptions_split)
+    pending_rows = [product_descriptions_split[i] for i in pending.values()]
+
+    if not pending_rows:
+        batches = []
+    elif batch_size:
+        batches = [
+            pending_rows[start : start + batch_size]
+            for start in range(0, len(pending_rows), batch_size)
+        ]
+    else:
+        batches = [pending_rows]
+
+    prompt_tokens = 0
+    completion_tokens = []
+    for batch in batches:
+        prompt_tokens += estimate_tokens(build_ai_prompt(batch))
+        completion_tokens.append(
+            min(
+                math.ceil(estimate_tokens(str(batch)) * COMPLETION_TOKEN_RATIO),
+                AI_MAX_TOKENS,
+            )
+        )
 
-        logger.info("DeepSeek处理后的产品描述: %s", processed_result)
-        return processed_result
+    history = get_call_history()
+    scheduler = get_scheduler()
+    concurrency = scheduler.max_concurrency
+    call_seconds = [history.estimate_latency(tokens) for tokens in completion_tokens]
+    ai_seconds = 0.0
+    if batches:
+        # 批次按全局并发上限同时处理，按最慢的一轮粗略估算
+        rounds = math.ceil(len(batches) / concurrency)
+        ai_seconds = max(call_seconds) * rounds
+
+    # 名额已满时，需要等待排在前面的调用完成
+    queue_seconds = 0.0
+    scheduler_stats = scheduler.stats()
+    if batches and scheduler_stats["active"] >= concurrency:
+        typical_seconds = history.estimate_latency(AI_MAX_TOKENS // 2)
+        queue_seconds = (
+            scheduler_stats["waiting"] // concurrency + 1
+        ) * typical_seconds
 
-    except Exception as e:
-        logger.error("DeepSeek处理产品描述失败: %s", str(e))
-        # 如果处理失败，返回原始数据
-        logger.info("使用原始产品描述数据")
-        return product_descriptions_split
+    return {
+        "total_rows": excel_shape[0],
+        "total_columns": excel_shape[1],
+        "row_count": len(product_descriptions_split),
+        "unique_row_count": len(set(fingerprints)),
+        "unique_item_count": len(
+            {item for items in product_descriptions_split for item in items}
+        ),
+        "rows_to_process": len(pending_rows),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": sum(completion_tokens),
+        "batches": len(batches),
+        "estimated_seconds": round(ai_seconds + queue_seconds, 2),
+        "estimated_ai_seconds": round(ai_seconds, 2),
+        "estimated_queue_seconds": round(queue_seconds, 2),
+        "latency_history_size": len(history.records()),
+    }
 
 
 def _parse_ai_response(processed_result):
@@ -174,22 +642,34 @@ def _parse_ai_response(processed_result):
     return processed_descriptions
 
 
-def build_excel_info(excel_data, product_descriptions_split, processed_descriptions):
+def build_excel_info(
+    excel_shape,
+    product_descriptions_split,
+    processed_descriptions,
+    recomputed_indices=None,
+):
     """
     构建Excel信息字典
 
     Args:
-        excel_data: pandas DataFrame对象
+        excel_shape: 表格的(数据行数, 列数)
         product_descriptions_split: 分割后的产品描述列表
         processed_descriptions: AI处理后的产品描述列表
+        recomputed_indices: 重新调用AI处理的行下标，为None时视为全部重新处理
 
     Returns:
         dict: Excel信息字典
     """
+    if recomputed_indices is None:
+        recomputed_indices = list(range(len(product_descriptions_split)))
+
     return {
-        "total_rows": len(excel_data),
-        "total_columns": len(excel_data.columns),
+        "total_rows": excel_shape[0],
+        "total_columns": excel_shape[1],
         "product_descriptions": product_descriptions_split,
         "product_descriptions_ai": processed_descriptions,
         "product_descriptions_count": len(product_descriptions_split),
+        "product_descriptions_recomputed": recomputed_indices,
+        "product_descriptions_reused_count": len(product_descriptions_split)
+        - len(recomputed_indices),
     }
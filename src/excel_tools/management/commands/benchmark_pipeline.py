@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: benchmark_pipeline
+@author: kody
+@create: 2026-10-19 17:02:36
+@desc: 运行excel_tools流水线基准，与保存的基准对比并在回归时失败
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from excel_tools.benchmarks import (
+    BASELINE_PATH,
+    DEFAULT_SIZES,
+    STAGES,
+    find_regressions,
+    generate_workbook,
+    input_throughput,
+    load_baseline,
+    run_benchmark,
+    save_baseline,
+)
+
+
+class Command(BaseCommand):
+    help = "测量excel_tools流水线各阶段在不同数据量下的耗时和峰值内存"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=DEFAULT_SIZES,
+            help="合成工作簿的产品描述行数",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="每个阶段的计时重复次数（取最小值）",
+        )
+        parser.add_argument(
+            "--time-threshold",
+            type=float,
+            default=0.5,
+            help="允许的耗时增长比例",
+        )
+        parser.add_argument(
+            "--memory-threshold",
+            type=float,
+            default=0.2,
+            help="允许的峰值内存增长比例",
+        )
+        parser.add_argument(
+            "--baseline",
+            default=str(BASELINE_PATH),
+            help="基准文件路径",
+        )
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="用本次结果覆盖基准，不做回归判断",
+        )
+
+    def handle(self, *args, **options):
+        baseline = load_baseline(options["baseline"])
+        regressions = []
+
+        for rows in options["sizes"]:
+            self.stdout.write(f"生成 {rows} 行合成工作簿...")
+            results = run_benchmark(
+                rows,
+                repeat=options["repeat"],
+                workbook=generate_workbook(rows),
+                csv_workbook=generate_workbook(rows, file_format="csv"),
+            )
+
+            self.stdout.write(f"{rows} 行:")
+            for stage in STAGES:
+                metrics = results[stage]
+                self.stdout.write(
+                    "  - %-30s %10.4fs %12.1f KB"
+                    % (stage, metrics["seconds"], metrics["peak_bytes"] / 1024)
+                )
+            throughput = input_throughput(results, rows)
+            self.stdout.write(
+                "  读取吞吐量: xlsx %.0f 行/秒，csv %.0f 行/秒（%.1fx）"
+                % (
+                    throughput["xlsx"],
+                    throughput["csv"],
+                    throughput["csv"] / throughput["xlsx"],
+                )
+            )
+
+            if options["update_baseline"]:
+                baseline[str(rows)] = results
+                continue
+
+            if str(rows) not in baseline:
+                self.stdout.write(self.style.WARNING(f"  {rows} 行没有基准数据"))
+                continue
+
+            for regression in find_regressions(
+                results,
+                baseline[str(rows)],
+                options["time_threshold"],
+                options["memory_threshold"],
+            ):
+                regressions.append(f"{rows} 行: {regression}")
+
+        if options["update_baseline"]:
+            save_baseline(baseline, options["baseline"])
+            self.stdout.write(self.style.SUCCESS(f"基准已更新: {options['baseline']}"))
+            return
+
+        if regressions:
+            raise CommandError("性能回归:\n" + "\n".join(regressions))
+
+        self.stdout.write(self.style.SUCCESS("未发现性能回归"))
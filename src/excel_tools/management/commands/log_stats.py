@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: log_stats
+@author: kody
+@create: 2026-10-19 10:12:41
+@desc: 单次流式扫描全部日志（含轮转文件），基于字节偏移检查点增量统计
+"""
+
+import hashlib
+import json
+import os
+import re
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# 日志族：django.log 记录请求，excel_tools.log 记录上传与流水线耗时。
+# runserver 的控制台输出也会重定向到 django.log，因此上传相关的行只从
+# excel_tools 日志族统计，避免重复计数。
+LOG_FAMILIES = ("django.log", "excel_tools.log")
+
+CHECKPOINT_FILE_NAME = ".log_stats_checkpoint.json"
+CHECKPOINT_VERSION = 2
+# 用文件开头的内容识别inode被复用的新文件
+HEAD_BYTES = 4096
+
+# 按日期统计的行数只保留最近的天数
+DATE_RETENTION_DAYS = 30
+
+# 直方图桶上界，最后一个桶为 +inf
+UPLOAD_SIZE_BUCKETS = [
+    10 * 1024,
+    100 * 1024,
+    1024 * 1024,
+    5 * 1024 * 1024,
+    10 * 1024 * 1024,
+]
+PIPELINE_DURATION_BUCKETS = [1, 2, 5, 10, 30, 60, 120]
+
+LEVEL_PATTERN = re.compile(rb"^(DEBUG|INFO|WARNING|ERROR|CRITICAL) ")
+DATE_PATTERN = re.compile(rb"^\w+ (\d{4}-\d{2}-\d{2}) ")
+REQUEST_PATTERN = re.compile(
+    rb'"(GET|POST|PUT|PATCH|DELETE|HEAD|OPTIONS) \S+ HTTP/[\d.]+" (\d{3})'
+)
+UPLOAD_SIZE_PATTERN = re.compile("接收到文件: .*, 大小: (\\d+) bytes".encode("utf-8"))
+PIPELINE_DURATION_PATTERN = re.compile(
+    "文件处理完成，耗时: ([\\d.]+)秒".encode("utf-8")
+)
+TRACEBACK_MARKER = b"Traceback (most recent call last)"
+
+
+def _empty_histogram(buckets):
+    return {
+        "buckets": list(buckets),
+        "counts": [0] * (len(buckets) + 1),
+        "count": 0,
+        "sum": 0.0,
+        "min": None,
+        "max": None,
+    }
+
+
+def _empty_family_stats():
+    return {
+        "lines": 0,
+        "bytes": 0,
+        "levels": {},
+        "tracebacks": 0,
+        "lines_by_date": {},
+    }
+
+
+def _empty_stats():
+    return {
+        "families": {family: _empty_family_stats() for family in LOG_FAMILIES},
+        "requests": {"total": 0, "methods": {}, "status_classes": {}},
+        "upload_size": _empty_histogram(UPLOAD_SIZE_BUCKETS),
+        "pipeline_duration": _empty_histogram(PIPELINE_DURATION_BUCKETS),
+    }
+
+
+def _observe(histogram, value):
+    """
+    向直方图中记录一个观测值
+
+    Args:
+        histogram: 直方图字典
+        value: 观测值
+    """
+    index = len(histogram["buckets"])
+    for i, upper in enumerate(histogram["buckets"]):
+        if value <= upper:
+            index = i
+            break
+    histogram["counts"][index] += 1
+    histogram["count"] += 1
+    histogram["sum"] += value
+    if histogram["min"] is None or value < histogram["min"]:
+        histogram["min"] = value
+    if histogram["max"] is None or value > histogram["max"]:
+        histogram["max"] = value
+
+
+def _percentile(histogram, ratio):
+    """
+    根据直方图估算分位数（返回所在桶的上界，溢出桶返回最大值）
+
+    Args:
+        histogram: 直方图字典
+        ratio: 分位比例，例如0.95
+
+    Returns:
+        估算的分位数，无数据时返回None
+    """
+    if not histogram["count"]:
+        return None
+    target = histogram["count"] * ratio
+    cumulative = 0
+    for i, count in enumerate(histogram["counts"]):
+        cumulative += count
+        if cumulative >= target:
+            if i < len(histogram["buckets"]):
+                return min(histogram["buckets"][i], histogram["max"])
+            return histogram["max"]
+    return histogram["max"]
+
+
+def _format_number(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:.3f}"
+
+
+def discover_log_files(log_dir):
+    """
+    查找日志目录下所有当前及轮转的日志文件
+
+    Args:
+        log_dir: 日志目录
+
+    Returns:
+        list: (family, path) 列表，轮转文件按从旧到新排列
+    """
+    log_files = []
+    for family in LOG_FAMILIES:
+        rotated = []
+        for path in log_dir.glob(f"{family}.*"):
+            suffix = path.name[len(family) + 1 :]
+            if suffix.isdigit():
+                rotated.append((int(suffix), path))
+        for _, path in sorted(rotated, reverse=True):
+            log_files.append((family, path))
+        current = log_dir / family
+        if current.is_file():
+            log_files.append((family, current))
+    return log_files
+
+
+def load_checkpoint(checkpoint_path):
+    """
+    读取检查点文件，不存在或版本不匹配时返回空检查点
+
+    Args:
+        checkpoint_path: 检查点文件路径
+
+    Returns:
+        dict: 检查点数据
+    """
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("version") == CHECKPOINT_VERSION:
+            return checkpoint
+    except (OSError, ValueError):
+        pass
+    return {"version": CHECKPOINT_VERSION, "files": {}, "stats": _empty_stats()}
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """
+    原子写入检查点文件
+
+    Args:
+        checkpoint_path: 检查点文件路径
+        checkpoint: 检查点数据
+    """
+    tmp_path = checkpoint_path.with_name(checkpoint_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def _scan_line(line, family, family_stats, stats):
+    family_stats["lines"] += 1
+
+    level_match = LEVEL_PATTERN.match(line)
+    if level_match:
+        level = level_match.group(1).decode("ascii")
+        family_stats["levels"][level] = family_stats["levels"].get(level, 0) + 1
+        date_match = DATE_PATTERN.match(line)
+        if date_match:
+            day = date_match.group(1).decode("ascii")
+            by_date = family_stats["lines_by_date"]
+            by_date[day] = by_date.get(day, 0) + 1
+    elif line.startswith(TRACEBACK_MARKER):
+        family_stats["tracebacks"] += 1
+
+    if family == "django.log":
+        request_match = REQUEST_PATTERN.search(line)
+        if request_match:
+            requests_stats = stats["requests"]
+            method = request_match.group(1).decode("ascii")
+            status_class = request_match.group(2).decode("ascii")[0] + "xx"
+            requests_stats["total"] += 1
+            requests_stats["methods"][method] = (
+                requests_stats["methods"].get(method, 0) + 1
+            )
+            requests_stats["status_classes"][status_class] = (
+                requests_stats["status_classes"].get(status_class, 0) + 1
+            )
+    else:
+        size_match = UPLOAD_SIZE_PATTERN.search(line)
+        if size_match:
+            _observe(stats["upload_size"], int(size_match.group(1)))
+            return
+        duration_match = PIPELINE_DURATION_PATTERN.search(line)
+        if duration_match:
+            _observe(stats["pipeline_duration"], float(duration_match.group(1)))
+
+
+def _head_digest(path, length):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read(length)).hexdigest()
+
+
+def scan_log_file(path, family, offset, stats):
+    """
+    从指定偏移处流式读取日志文件并累加统计，只处理完整的行
+
+    Args:
+        path: 日志文件路径
+        family: 日志族名称
+        offset: 起始字节偏移
+        stats: 累计统计字典
+
+    Returns:
+        int: 处理到的新字节偏移
+    """
+    family_stats = stats["families"][family]
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            # 正在写入的半行留到下次再读
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            family_stats["bytes"] += len(line)
+            _scan_line(line, family, family_stats, stats)
+    return offset
+
+
+def update_stats(log_dir, checkpoint):
+    """
+    扫描所有日志文件的新增内容并更新检查点
+
+    文件以 (st_dev, st_ino) 标识，log_rotate.sh 通过 mv 轮转日志，
+    因此 django.log 变为 django.log.1 后仍能从原偏移继续读取。删除后新建的
+    文件可能复用旧inode，所以同时记录文件开头的摘要，不一致时从头读取。
+
+    Args:
+        log_dir: 日志目录
+        checkpoint: 检查点数据（原地更新）
+
+    Returns:
+        int: 本次读取的字节数
+    """
+    stats = checkpoint["stats"]
+    old_files = checkpoint["files"]
+    new_files = {}
+    bytes_read = 0
+
+    for family, path in discover_log_files(log_dir):
+        stat = path.stat()
+        file_key = f"{stat.st_dev}:{stat.st_ino}"
+        old_file = old_files.get(file_key, {})
+        offset = old_file.get("offset", 0)
+        # 文件被截断或inode被复用时从头读取
+        if offset > stat.st_size or (
+            offset
+            and _head_digest(path, old_file["head_length"]) != old_file["head_sha256"]
+        ):
+            offset = 0
+        new_offset = scan_log_file(path, family, offset, stats)
+        bytes_read += new_offset - offset
+        head_length = min(HEAD_BYTES, new_offset)
+        new_files[file_key] = {
+            "path": str(path),
+            "family": family,
+            "offset": new_offset,
+            "head_length": head_length,
+            "head_sha256": _head_digest(path, head_length),
+        }
+
+    # 已删除的轮转文件不再跟踪，其统计结果保留在累计数据中
+    checkpoint["files"] = new_files
+
+    cutoff = (date.today() - timedelta(days=DATE_RETENTION_DAYS)).isoformat()
+    for family_stats in stats["families"].values():
+        by_date = family_stats["lines_by_date"]
+        for day in [day for day in by_date if day < cutoff]:
+            del by_date[day]
+
+    return bytes_read
+
+
+class Command(BaseCommand):
+    help = "流式统计当前及轮转日志的错误、请求、上传大小和处理耗时分布"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--log-dir",
+            default=str(settings.BASE_DIR.parent / "logs"),
+            help="日志目录，默认为项目根目录下的logs",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=None,
+            help=f"检查点文件路径，默认为日志目录下的{CHECKPOINT_FILE_NAME}",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="丢弃检查点，从头重新统计",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="以JSON格式输出统计结果",
+        )
+
+    def handle(self, *args, **options):
+        log_dir = Path(options["log_dir"])
+        if not log_dir.is_dir():
+            raise CommandError(f"日志目录不存在: {log_dir}")
+
+        checkpoint_path = Path(options["checkpoint"] or log_dir / CHECKPOINT_FILE_NAME)
+        if options["reset"] and checkpoint_path.exists():
+            checkpoint_path.unlink()
+
+        checkpoint = load_checkpoint(checkpoint_path)
+        bytes_read = update_stats(log_dir, checkpoint)
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        if options["json"]:
+            self.stdout.write(
+                json.dumps(checkpoint["stats"], ensure_ascii=False, indent=2)
+            )
+            return
+
+        self._print_report(checkpoint, bytes_read)
+
+    def _print_report(self, checkpoint, bytes_read):
+        stats = checkpoint["stats"]
+        today = date.today()
+        yesterday = (today - timedelta(days=1)).isoformat()
+        today = today.isoformat()
+
+        self.stdout.write("📈 日志统计信息")
+        self.stdout.write("==================")
+        self.stdout.write(
+            f"跟踪文件数: {len(checkpoint['files'])}，本次新读取: {bytes_read} bytes"
+        )
+
+        for family, family_stats in stats["families"].items():
+            levels = family_stats["levels"]
+            errors = levels.get("ERROR", 0) + levels.get("CRITICAL", 0)
+            by_date = family_stats["lines_by_date"]
+            self.stdout.write("")
+            self.stdout.write(f"{family}（含轮转文件）:")
+            self.stdout.write(f"  - 总行数: {family_stats['lines']}")
+            self.stdout.write(f"  - 总大小: {family_stats['bytes']} bytes")
+            self.stdout.write(f"  - 错误数量: {errors}")
+            self.stdout.write(f"  - 异常堆栈数量: {family_stats['tracebacks']}")
+            self.stdout.write(f"  - 警告数量: {levels.get('WARNING', 0)}")
+            self.stdout.write(f"  - 今日日志行数: {by_date.get(today, 0)}")
+            self.stdout.write(f"  - 昨日日志行数: {by_date.get(yesterday, 0)}")
+
+        requests_stats = stats["requests"]
+        self.stdout.write("")
+        self.stdout.write(f"请求数量: {requests_stats['total']}")
+        for method, count in sorted(requests_stats["methods"].items()):
+            self.stdout.write(f"  - {method}: {count}")
+        for status_class, count in sorted(requests_stats["status_classes"].items()):
+            self.stdout.write(f"  - {status_class}: {count}")
+
+        self._print_histogram("上传文件大小分布", stats["upload_size"], "bytes")
+        self._print_histogram("处理耗时分布", stats["pipeline_duration"], "秒")
+
+    def _print_histogram(self, title, histogram, unit):
+        self.stdout.write("")
+        self.stdout.write(f"{title}（{unit}）:")
+        if not histogram["count"]:
+            self.stdout.write("  - 无数据")
+            return
+
+        average = histogram["sum"] / histogram["count"]
+        self.stdout.write(f"  - 次数: {histogram['count']}")
+        self.stdout.write(
+            "  - 最小/平均/最大: %s / %.2f / %s"
+            % (
+                _format_number(histogram["min"]),
+                average,
+                _format_number(histogram["max"]),
+            )
+        )
+        self.stdout.write(
+            "  - P50/P95（桶上界估算）: %s / %s"
+            % (
+                _format_number(_percentile(histogram, 0.5)),
+                _format_number(_percentile(histogram, 0.95)),
+            )
+        )
+        lower = 0
+        for upper, count in zip(histogram["buckets"] + [None], histogram["counts"]):
+            if upper is None:
+                label = f"> {_format_number(lower)}"
+            else:
+                label = f"{_format_number(lower)} ~ {_format_number(upper)}"
+            self.stdout.write(f"  - {label}: {count}")
+            lower = upper
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: process_excel_dir
+@author: kody
+@create: 2026-10-19 14:05:18
+@desc: 离线批量处理目录中的Excel文件，多进程解析、限并发调用AI，支持断点续跑
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from common.deepseek import scheduler_job
+from excel_tools.common import (
+    CSV_DELIMITERS,
+    build_excel_info,
+    read_product_descriptions,
+    request_ai_processing,
+    split_product_descriptions,
+)
+
+INPUT_EXTENSIONS = (".xlsx", ".xls", *CSV_DELIMITERS)
+CHECKPOINT_DIR_NAME = ".checkpoints"
+CHECKPOINT_VERSION = 1
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _batch_key(batch):
+    content = json.dumps(batch, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def parse_excel_path(path):
+    """
+    解析单个Excel/CSV文件（在子进程中执行）
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        dict: 包含行列数和分割后产品描述的解析结果
+    """
+    with open(path, "rb") as f:
+        product_descriptions, excel_shape = read_product_descriptions(f)
+    return {
+        "total_rows": excel_shape[0],
+        "total_columns": excel_shape[1],
+        "product_descriptions": split_product_descriptions(product_descriptions),
+    }
+
+
+def request_batch(job_key, job_size, batch):
+    """
+    在文件对应的调度作业中处理一个批次，同一文件的批次在调度器中共享队列
+
+    Args:
+        job_key: 调度作业标识
+        job_size: 文件的产品描述总条数
+        batch: 分割后的产品描述批次
+
+    Returns:
+        list: AI处理后的产品描述列表
+    """
+    with scheduler_job(job_key, job_size):
+        return request_ai_processing(batch)
+
+
+class FileCheckpoint:
+    """单个文件的检查点，记录解析结果和每个批次的AI结果"""
+
+    def __init__(self, path, digest):
+        self.path = path
+        self.data = {
+            "version": CHECKPOINT_VERSION,
+            "digest": digest,
+            "parsed": None,
+            "batches": {},
+            "completed": False,
+        }
+
+    @classmethod
+    def load(cls, path, digest):
+        """
+        读取检查点，源文件内容变化（摘要不一致）时返回空检查点
+
+        Args:
+            path: 检查点文件路径
+            digest: 源文件的sha256摘要
+
+        Returns:
+            FileCheckpoint: 检查点对象
+        """
+        checkpoint = cls(path, digest)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if (
+                data.get("version") == CHECKPOINT_VERSION
+                and data.get("digest") == digest
+            ):
+                checkpoint.data = data
+        except (OSError, ValueError):
+            pass
+        return checkpoint
+
+    def save(self):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class Command(BaseCommand):
+    help = "离线批量处理目录中的Excel/CSV文件（解析、分割、AI清洗），支持断点续跑"
+
+    def add_arguments(self, parser):
+        parser.add_argument("input_dir", help="Excel/CSV文件所在目录")
+        parser.add_argument(
+            "--output-dir",
+            default=None,
+            help="输出目录，默认为输入目录下的output",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="解析文件的进程数",
+        )
+        parser.add_argument(
+            "--ai-concurrency",
+            type=int,
+            default=4,
+            help="同时进行的AI调用数",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="每次AI调用处理的产品描述条数",
+        )
+        parser.add_argument(
+            "--format",
+            choices=["json", "xlsx", "both"],
+            default="both",
+            help="输出文件格式",
+        )
+
+    def handle(self, *args, **options):
+        input_dir = Path(options["input_dir"])
+        if not input_dir.is_dir():
+            raise CommandError(f"输入目录不存在: {input_dir}")
+        for name in ("workers", "ai_concurrency", "batch_size"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} 必须大于0")
+
+        output_dir = Path(options["output_dir"] or input_dir / "output")
+        checkpoint_dir = output_dir / CHECKPOINT_DIR_NAME
+        checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.output_format = options["format"]
+        self.output_dir = output_dir
+
+        paths = sorted(
+            path
+            for path in input_dir.iterdir()
+            if path.is_file() and path.suffix.lower() in INPUT_EXTENSIONS
+        )
+        self.stdout.write(f"共找到 {len(paths)} 个待处理文件")
+
+        checkpoints = {}
+        for path in paths:
+            checkpoint = FileCheckpoint.load(
+                checkpoint_dir / f"{path.name}.json", _file_digest(path)
+            )
+            if checkpoint.data["completed"]:
+                self.stdout.write(f"跳过已完成文件: {path.name}")
+                continue
+            checkpoints[path] = checkpoint
+
+        failed = set()
+        self._parse_files(checkpoints, options["workers"], failed)
+        self._process_batches(
+            checkpoints, options["ai_concurrency"], options["batch_size"], failed
+        )
+
+        for path, checkpoint in checkpoints.items():
+            if path in failed:
+                continue
+            self._write_outputs(path, checkpoint, options["batch_size"])
+            checkpoint.data["completed"] = True
+            checkpoint.save()
+            self.stdout.write(self.style.SUCCESS(f"处理完成: {path.name}"))
+
+        if failed:
+            raise CommandError(
+                f"{len(failed)} 个文件处理失败，重新执行命令将从检查点继续: "
+                + ", ".join(sorted(path.name for path in failed))
+            )
+
+    def _parse_files(self, checkpoints, workers, failed):
+        pending = [
+            path
+            for path, checkpoint in checkpoints.items()
+            if checkpoint.data["parsed"] is None
+        ]
+        if not pending:
+            return
+
+        self.stdout.write(f"使用 {workers} 个进程解析 {len(pending)} 个文件")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(parse_excel_path, path): path for path in pending
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    checkpoints[path].data["parsed"] = future.result()
+                except Exception as e:
+                    self.stderr.write(f"解析失败: {path.name}: {e}")
+                    failed.add(path)
+                    continue
+                checkpoints[path].save()
+
+    def _process_batches(self, checkpoints, ai_concurrency, batch_size, failed):
+        tasks = []
+        for path, checkpoint in checkpoints.items():
+            if path in failed:
+                continue
+            descriptions = checkpoint.data["parsed"]["product_descriptions"]
+            for start in range(0, len(descriptions), batch_size):
+                batch = descriptions[start : start + batch_size]
+                key = _batch_key(batch)
+                if key not in checkpoint.data["batches"]:
+                    tasks.append((path, key, batch, len(descriptions)))
+        if not tasks:
+            return
+
+        self.stdout.write(f"以 {ai_concurrency} 个并发处理 {len(tasks)} 个AI批次")
+        executor = ThreadPoolExecutor(max_workers=ai_concurrency)
+        futures = {
+            executor.submit(request_batch, str(path), size, batch): (path, key)
+            for path, key, batch, size in tasks
+        }
+        try:
+            # 检查点只在主线程中写入，每完成一个批次立即落盘
+            for future in as_completed(futures):
+                path, key = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.stderr.write(f"AI处理失败: {path.name}: {e}")
+                    failed.add(path)
+                    continue
+                checkpoints[path].data["batches"][key] = result
+                checkpoints[path].save()
+        except BaseException:
+            # 中断或写检查点失败时取消排队中的批次（每个批次都是付费调用），
+            # 等待进行中的批次结束并保存其结果后再抛出
+            executor.shutdown(wait=True, cancel_futures=True)
+            self._save_finished_batches(checkpoints, futures)
+            raise
+        executor.shutdown()
+
+    def _save_finished_batches(self, checkpoints, futures):
+        finished = set()
+        for future, (path, key) in futures.items():
+            if future.cancelled() or future.exception() is not None:
+                continue
+            batches = checkpoints[path].data["batches"]
+            if key not in batches:
+                batches[key] = future.result()
+                finished.add(path)
+        for path in finished:
+            try:
+                checkpoints[path].save()
+            except Exception as e:
+                self.stderr.write(f"保存检查点失败: {path.name}: {e}")
+
+    def _write_outputs(self, path, checkpoint, batch_size):
+        parsed = checkpoint.data["parsed"]
+        descriptions = parsed["product_descriptions"]
+        processed = []
+        for start in range(0, len(descriptions), batch_size):
+            batch = descriptions[start : start + batch_size]
+            processed.extend(checkpoint.data["batches"][_batch_key(batch)])
+
+        # 与上传接口的返回结构一致，离线处理不复用缓存，全部行都重新处理
+        excel_info = build_excel_info(
+            (parsed["total_rows"], parsed["total_columns"]), descriptions, processed
+        )
+
+        if self.output_format in ("json", "both"):
+            with open(
+                self.output_dir / f"{path.name}.json", "w", encoding="utf-8"
+            ) as f:
+                json.dump(
+                    {"file_name": path.name, "excel_info": excel_info},
+                    f,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+
+        if self.output_format in ("xlsx", "both"):
+            with pd.ExcelWriter(self.output_dir / f"{path.name}.xlsx") as writer:
+                pd.DataFrame(
+                    {"Product Description": [" | ".join(i) for i in descriptions]}
+                ).to_excel(writer, sheet_name="product_descriptions", index=False)
+                pd.DataFrame(
+                    {"Product Description": [" | ".join(i) for i in processed]}
+                ).to_excel(writer, sheet_name="product_descriptions_ai", index=False)
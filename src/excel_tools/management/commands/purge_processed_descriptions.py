@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: purge_processed_descriptions
+@author: kody
+@create: 2026-10-19 21:14:52
+@desc: 清理增量处理保存的行结果，之后上传的行会重新发送给AI
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from excel_tools.models import ProcessedDescription
+
+
+class Command(BaseCommand):
+    help = "清理增量处理缓存的AI行结果"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=None,
+            help="只清理保存时间超过指定天数的结果，默认全部清理",
+        )
+
+    def handle(self, *args, **options):
+        queryset = ProcessedDescription.objects.all()
+        if options["older_than"] is not None:
+            if options["older_than"] < 0:
+                raise CommandError("--older-than 不能小于0")
+            cutoff = timezone.now() - timedelta(days=options["older_than"])
+            queryset = queryset.filter(created_at__lt=cutoff)
+
+        deleted, _ = queryset.delete()
+        self.stdout.write(self.style.SUCCESS(f"已清理 {deleted} 条缓存结果"))
@@ -1,2 +1,14 @@
+from django.db import models
 
 # Create your models here.
+
+
+class ProcessedDescription(models.Model):
+    """AI处理过的产品描述行，按指纹复用"""
+
+    fingerprint = models.CharField(max_length=64, unique=True)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.fingerprint
@@ -1,2 +1,607 @@
+import io
+import json
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from common.deepseek import (
+    DeepSeekClient,
+    DeepSeekKeyPool,
+    DeepSeekScheduler,
+    scheduler_job,
+)
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from .benchmarks import (
+    find_regressions,
+    generate_workbook,
+    load_baseline,
+    run_benchmark,
+)
+from .common import (
+    ENCODING_SAMPLE_SIZE,
+    estimate_processing,
+    extract_product_descriptions,
+    fingerprint_description,
+    lookup_processed_descriptions,
+    process_descriptions_incrementally,
+    read_excel_file,
+    read_product_descriptions,
+    scan_product_descriptions,
+)
+from .models import ProcessedDescription
 
 # Create your tests here.
+
+
+class LogStatsTests(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.log_dir = Path(tmp_dir.name)
+        self.log_file = self.log_dir / "django.log"
+
+    def _line(self, level="INFO", status=200):
+        return (
+            f'{level} 2026-10-19 10:00:00,000 basehttp 1 2 "GET /api HTTP/1.1" '
+            f"{status} 12\n"
+        ).encode("ascii")
+
+    def _append(self, path, data):
+        with open(path, "ab") as f:
+            f.write(data)
+
+    def _stats(self):
+        stdout = io.StringIO()
+        call_command("log_stats", log_dir=str(self.log_dir), json=True, stdout=stdout)
+        return json.loads(stdout.getvalue())
+
+    def _lines(self, stats):
+        return stats["families"]["django.log"]["lines"]
+
+    def test_resumes_across_rotation(self):
+        self._append(self.log_file, self._line() * 3)
+        self.assertEqual(self._lines(self._stats()), 3)
+
+        # log_rotate.sh通过mv轮转，旧文件在轮转后仍可能被追加
+        self.log_file.rename(self.log_dir / "django.log.1")
+        self._append(self.log_dir / "django.log.1", self._line("ERROR", 500))
+        self._append(self.log_file, self._line() * 2)
+        stats = self._stats()
+
+        self.assertEqual(self._lines(stats), 6)
+        self.assertEqual(stats["families"]["django.log"]["levels"]["ERROR"], 1)
+        self.assertEqual(stats["requests"]["status_classes"], {"2xx": 5, "5xx": 1})
+        self.assertEqual(self._stats(), stats)
+
+    def test_half_written_line_is_read_later(self):
+        line = self._line()
+        self._append(self.log_file, line + line[:10])
+        self.assertEqual(self._lines(self._stats()), 1)
+
+        self._append(self.log_file, line[10:])
+        self.assertEqual(self._lines(self._stats()), 2)
+
+    def test_truncated_file_is_read_from_start(self):
+        self._append(self.log_file, self._line() * 3)
+        self._stats()
+
+        self.log_file.write_bytes(self._line("WARNING"))
+        stats = self._stats()
+
+        self.assertEqual(self._lines(stats), 4)
+        self.assertEqual(stats["families"]["django.log"]["levels"]["WARNING"], 1)
+
+    def test_reused_inode_is_read_from_start(self):
+        self._append(self.log_file, self._line() * 3)
+        self._stats()
+
+        # 同一inode写入更长的新内容，偏移量仍在文件范围内
+        with open(self.log_file, "r+b") as f:
+            f.write(self._line("WARNING") * 5)
+        stats = self._stats()
+
+        self.assertEqual(self._lines(stats), 8)
+        self.assertEqual(stats["families"]["django.log"]["levels"]["WARNING"], 5)
+
+    def test_old_checkpoint_version_is_discarded(self):
+        self._append(self.log_file, self._line() * 3)
+        stats = self._stats()
+        checkpoint_path = self.log_dir / ".log_stats_checkpoint.json"
+        checkpoint = json.loads(checkpoint_path.read_text(encoding="utf-8"))
+        checkpoint["version"] -= 1
+        checkpoint["stats"]["families"]["django.log"]["lines"] = 100
+        checkpoint_path.write_text(json.dumps(checkpoint), encoding="utf-8")
+
+        self.assertEqual(self._stats(), stats)
+
+
+class ProcessExcelDirTests(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.input_dir = Path(tmp_dir.name)
+        for name, rows in (("a.csv", 120), ("b.csv", 30)):
+            (self.input_dir / name).write_bytes(
+                generate_workbook(rows, file_format="csv").getvalue()
+            )
+        self.batches = []
+
+    def _request_ai_processing(self, fail_batch):
+        def request_ai_processing(batch):
+            self.batches.append(batch[0][-1])
+            if batch[0][-1] == fail_batch:
+                raise RuntimeError("boom")
+            return [items[:1] for items in batch]
+
+        return request_ai_processing
+
+    def _run(self, fail_batch=None):
+        self.batches = []
+        with mock.patch(
+            "excel_tools.management.commands.process_excel_dir.request_ai_processing",
+            side_effect=self._request_ai_processing(fail_batch),
+        ):
+            call_command(
+                "process_excel_dir",
+                str(self.input_dir),
+                workers=1,
+                batch_size=50,
+                format="json",
+                stdout=io.StringIO(),
+                stderr=io.StringIO(),
+            )
+
+    def test_rerun_only_sends_failed_batches(self):
+        with self.assertRaises(CommandError):
+            self._run(fail_batch="Batch 50")
+        self.assertEqual(
+            sorted(self.batches), ["Batch 0", "Batch 0", "Batch 100", "Batch 50"]
+        )
+        self.assertTrue((self.input_dir / "output" / "b.csv.json").exists())
+        self.assertFalse((self.input_dir / "output" / "a.csv.json").exists())
+
+        self._run()
+
+        self.assertEqual(self.batches, ["Batch 50"])
+        with open(self.input_dir / "output" / "a.csv.json", encoding="utf-8") as f:
+            excel_info = json.load(f)["excel_info"]
+        self.assertEqual(excel_info["product_descriptions_count"], 120)
+        self.assertEqual(excel_info["product_descriptions_ai"][50], ["Model X50"])
+        self.assertEqual(excel_info["product_descriptions_reused_count"], 0)
+
+
+class PipelineBenchmarkTests(SimpleTestCase):
+    def test_generated_workbook_matches_upload_layout(self):
+        excel_data = read_excel_file(generate_workbook(100))
+        descriptions = extract_product_descriptions(excel_data)
+
+        self.assertEqual(len(descriptions), 100)
+        self.assertTrue(descriptions[0].startswith("Model X0 |"))
+
+    def test_no_memory_regression_against_baseline(self):
+        baseline = load_baseline().get("1000")
+        if baseline is None:
+            self.skipTest("没有1000行的基准数据")
+
+        results = run_benchmark(1000, repeat=1)
+
+        # 耗时取决于运行机器，只在benchmark_pipeline命令中对比，这里只比较峰值内存
+        regressions = find_regressions(
+            results, baseline, time_threshold=float("inf"), memory_threshold=0.2
+        )
+        self.assertEqual(regressions, [])
+
+
+class CsvInputTests(SimpleTestCase):
+    def _upload(self, name, text, encoding="utf-8", delimiter=","):
+        lines = [delimiter.join(["h"] * 6)]
+        lines += [delimiter.join([""] * 6)] * 16
+        lines += [delimiter.join(["", "", "", "", "", text]), ""]
+        return SimpleUploadedFile(name, "\n".join(lines).encode(encoding))
+
+    def test_csv_matches_xlsx_layout(self):
+        workbook = generate_workbook(50)
+        csv_file = SimpleUploadedFile(
+            "a.csv", generate_workbook(50, file_format="csv").getvalue()
+        )
+        workbook.name = "a.xlsx"
+
+        self.assertEqual(
+            read_product_descriptions(csv_file), read_product_descriptions(workbook)
+        )
+
+    def test_detects_gb18030_encoding(self):
+        uploaded_file = self._upload("a.csv", "不锈钢螺丝 | 规格M6", encoding="gb18030")
+
+        descriptions, _ = read_product_descriptions(uploaded_file)
+
+        self.assertEqual(descriptions, ["不锈钢螺丝 | 规格M6"])
+        self.assertFalse(uploaded_file.closed)
+
+    def test_reads_tsv_with_bom(self):
+        uploaded_file = self._upload(
+            "a.tsv", "Bolt, M6 | steel", encoding="utf-8-sig", delimiter="\t"
+        )
+
+        descriptions, excel_shape = read_product_descriptions(uploaded_file)
+
+        self.assertEqual(descriptions, ["Bolt, M6 | steel"])
+        self.assertEqual(excel_shape, (17, 6))
+
+    def _upload_after_ascii(self, name, text_bytes):
+        # 超过编码检测样本大小的ASCII行，非ASCII内容只出现在样本之后
+        padding = (",".join(["x" * 20] * 6) + "\n") * 4000
+        self.assertGreater(len(padding), ENCODING_SAMPLE_SIZE)
+        return SimpleUploadedFile(
+            name, padding.encode("ascii") + b",,,,," + text_bytes + b"\n"
+        )
+
+    def test_non_ascii_after_sample_is_decoded_strictly(self):
+        uploaded_file = self._upload_after_ascii(
+            "a.csv", "不锈钢螺丝".encode("gb18030")
+        )
+
+        descriptions, _ = read_product_descriptions(uploaded_file)
+
+        self.assertEqual(descriptions[-1], "不锈钢螺丝")
+
+    def test_undecodable_csv_is_rejected(self):
+        uploaded_file = self._upload_after_ascii("a.csv", b"\xff\xfe\xff")
+
+        with self.assertRaises(ValueError):
+            read_product_descriptions(uploaded_file)
+
+
+class IncrementalProcessingTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            "excel_tools.common.request_ai_processing",
+            side_effect=lambda rows: [items[:1] for items in rows],
+        )
+        self.request_ai_processing = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_only_changed_rows_are_sent_to_ai(self):
+        first = [["A", "red"], ["B", "blue"], ["C", "green"]]
+        process_descriptions_incrementally(first)
+
+        revised = [["A", "red"], ["B", "navy"], ["C", "green"], ["D", "black"]]
+        processed, recomputed = process_descriptions_incrementally(revised)
+
+        self.assertEqual(processed, [["A"], ["B"], ["C"], ["D"]])
+        self.assertEqual(recomputed, [1, 3])
+        self.request_ai_processing.assert_called_with([["B", "navy"], ["D", "black"]])
+        self.assertEqual(ProcessedDescription.objects.count(), 5)
+
+    def test_cache_lookup_is_chunked(self):
+        rows = [[f"Model {i}", "steel"] for i in range(5)]
+        process_descriptions_incrementally(rows)
+
+        with mock.patch("excel_tools.common.FINGERPRINT_QUERY_CHUNK_SIZE", 2):
+            with self.assertNumQueries(3):
+                _, cached, pending = lookup_processed_descriptions(
+                    rows + [["Model 5", "steel"], rows[0]]
+                )
+
+        self.assertEqual(len(cached), 5)
+        self.assertEqual(list(pending.values()), [5])
+
+    def test_ai_failure_is_not_cached(self):
+        self.request_ai_processing.side_effect = RuntimeError("boom")
+
+        processed, recomputed = process_descriptions_incrementally([["A", "red"]])
+
+        self.assertEqual(processed, [["A", "red"]])
+        self.assertEqual(recomputed, [0])
+        self.assertFalse(ProcessedDescription.objects.exists())
+
+    def test_mismatched_ai_response_keeps_rows_aligned(self):
+        process_descriptions_incrementally([["C", "green"]])
+        self.request_ai_processing.side_effect = lambda rows: [["merged"]]
+
+        processed, recomputed = process_descriptions_incrementally(
+            [["A", "red"], ["C", "green"], ["B", "blue"]]
+        )
+
+        self.assertEqual(processed, [["A", "red"], ["C"], ["B", "blue"]])
+        self.assertEqual(recomputed, [0, 2])
+        self.assertEqual(ProcessedDescription.objects.count(), 1)
+
+    def test_changed_ai_parameters_invalidate_results(self):
+        process_descriptions_incrementally([["A", "red"]])
+
+        with mock.patch("excel_tools.common.AI_TEMPERATURE", 0.9):
+            _, recomputed = process_descriptions_incrementally([["A", "red"]])
+
+        self.assertEqual(recomputed, [0])
+        self.assertEqual(self.request_ai_processing.call_count, 2)
+
+    def test_purge_command_removes_results(self):
+        process_descriptions_incrementally([["A", "red"], ["B", "blue"]])
+        ProcessedDescription.objects.filter(result=["A"]).update(
+            created_at=timezone.now() - timedelta(days=10)
+        )
+
+        call_command("purge_processed_descriptions", older_than=7, stdout=io.StringIO())
+        self.assertEqual(
+            list(ProcessedDescription.objects.values_list("result", flat=True)),
+            [["B"]],
+        )
+
+        call_command("purge_processed_descriptions", stdout=io.StringIO())
+        self.assertFalse(ProcessedDescription.objects.exists())
+
+
+class EstimateTests(TestCase):
+    def test_scan_matches_full_read(self):
+        workbook = generate_workbook(200)
+        workbook.name = "a.xlsx"
+
+        self.assertEqual(
+            scan_product_descriptions(workbook), read_product_descriptions(workbook)
+        )
+
+    def test_scan_handles_worksheet_without_dimension(self):
+        source = zipfile.ZipFile(generate_workbook(200))
+        workbook = io.BytesIO()
+        with zipfile.ZipFile(workbook, "w") as target:
+            for item in source.infolist():
+                data = source.read(item)
+                if item.filename.startswith("xl/worksheets/"):
+                    data = re.sub(rb"<dimension [^>]*/>", b"", data)
+                target.writestr(item, data)
+        workbook.name = "a.xlsx"
+
+        self.assertEqual(
+            scan_product_descriptions(workbook), read_product_descriptions(workbook)
+        )
+
+    def test_estimate_looks_up_cache_in_chunks(self):
+        ProcessedDescription.objects.create(
+            fingerprint=fingerprint_description(["Model 3", "steel"]),
+            result=["Model 3"],
+        )
+        descriptions = [f"Model {i} | steel" for i in range(5)] * 2
+
+        with mock.patch("excel_tools.common.FINGERPRINT_QUERY_CHUNK_SIZE", 2):
+            estimate = estimate_processing(descriptions, (26, 6))
+
+        self.assertEqual(estimate["unique_row_count"], 5)
+        self.assertEqual(estimate["rows_to_process"], 4)
+
+    def test_estimate_skips_cached_rows_without_calling_ai(self):
+        ProcessedDescription.objects.create(
+            fingerprint=fingerprint_description(["Model X0", "Stainless steel"]),
+            result=["Model X0"],
+        )
+        rows = "\n".join(
+            ["h,h,h,h,h,h"]
+            + [",,,,,"] * 16
+            + [
+                ",,,,,Model X0 | Stainless steel",
+                ",,,,,Model X0 | Stainless steel",
+                ",,,,,Model X1 | Stainless steel",
+                ",,,,,Model X1 | Stainless steel",
+                ",,,,,Model X2 | 304",
+            ]
+        )
+
+        with mock.patch("excel_tools.common.request_ai_processing") as request_ai:
+            response = self.client.post(
+                "/api/excel-tools/file/estimate",
+                {
+                    "file": SimpleUploadedFile("a.csv", rows.encode("utf-8")),
+                    "batch_size": "1",
+                },
+                HTTP_HOST="localhost",
+            )
+
+        request_ai.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        estimate = response.json()["estimate"]
+        self.assertEqual(estimate["row_count"], 5)
+        self.assertEqual(estimate["unique_row_count"], 3)
+        self.assertEqual(estimate["unique_item_count"], 5)
+        self.assertEqual(estimate["rows_to_process"], 2)
+        self.assertEqual(estimate["batches"], 2)
+        self.assertGreater(estimate["prompt_tokens"], 0)
+        self.assertGreater(estimate["estimated_seconds"], 0)
+
+
+class SchedulerTests(SimpleTestCase):
+    def _call(self, scheduler, key, size, order):
+        with scheduler_job(key, size):
+            with scheduler.slot():
+                order.append(key)
+
+    def _dispatch_order(self, scheduler, jobs):
+        """占住唯一名额后按顺序排队，释放后返回各调用实际获得名额的顺序"""
+        order = []
+        threads = []
+        # 占位作业按大作业调度，不计入小作业连续次数
+        with scheduler_job("holder", scheduler.small_job_size + 1):
+            with scheduler.slot():
+                for key, size in jobs:
+                    thread = threading.Thread(
+                        target=self._call, args=(scheduler, key, size, order)
+                    )
+                    thread.start()
+                    threads.append(thread)
+                    while scheduler.stats()["waiting"] < len(threads):
+                        time.sleep(0.001)
+        for thread in threads:
+            thread.join(timeout=5)
+        return order
+
+    def test_round_robin_between_jobs(self):
+        scheduler = DeepSeekScheduler(max_concurrency=1, small_job_size=0)
+
+        order = self._dispatch_order(
+            scheduler, [("a", 10), ("a", 10), ("a", 10), ("b", 10), ("b", 10)]
+        )
+
+        self.assertEqual(order, ["a", "b", "a", "b", "a"])
+
+    def test_small_jobs_first_with_bounded_burst(self):
+        scheduler = DeepSeekScheduler(
+            max_concurrency=1, small_job_size=5, max_small_burst=2
+        )
+
+        order = self._dispatch_order(
+            scheduler, [("large", 100)] * 3 + [("small", 1)] * 4
+        )
+
+        self.assertEqual(
+            order, ["small", "small", "large", "small", "small", "large", "large"]
+        )
+
+    def test_slot_released_when_call_raises(self):
+        scheduler = DeepSeekScheduler(max_concurrency=1)
+
+        with self.assertRaises(ValueError):
+            with scheduler.slot():
+                raise ValueError("boom")
+
+        self.assertEqual(scheduler.stats(), {"active": 0, "waiting": 0})
+        with scheduler.slot():
+            self.assertEqual(scheduler.stats()["active"], 1)
+
+    def test_interrupted_waiter_leaves_queue(self):
+        scheduler = DeepSeekScheduler(max_concurrency=1)
+
+        with scheduler.slot():
+            with mock.patch.object(
+                scheduler._cond, "wait", side_effect=KeyboardInterrupt
+            ):
+                with self.assertRaises(KeyboardInterrupt):
+                    with scheduler.slot():
+                        pass
+            self.assertEqual(scheduler.stats(), {"active": 1, "waiting": 0})
+
+        self.assertEqual(scheduler.stats(), {"active": 0, "waiting": 0})
+
+    def test_requests_per_minute_cap(self):
+        scheduler = DeepSeekScheduler(max_concurrency=5, max_requests_per_minute=2)
+        for _ in range(2):
+            with scheduler.slot():
+                pass
+
+        timeouts = []
+
+        def wait(timeout=None):
+            timeouts.append(timeout)
+            raise KeyboardInterrupt
+
+        # 名额空闲，但一分钟内已发起2次调用，第3次调用需要等待窗口滑出
+        with mock.patch.object(scheduler._cond, "wait", side_effect=wait):
+            with self.assertRaises(KeyboardInterrupt):
+                with scheduler.slot():
+                    pass
+
+        self.assertEqual(len(timeouts), 1)
+        self.assertGreater(timeouts[0], 59)
+        self.assertLessEqual(timeouts[0], 60)
+        self.assertEqual(scheduler.stats(), {"active": 0, "waiting": 0})
+
+
+class KeyPoolTests(SimpleTestCase):
+    def test_rate_limited_key_cools_down(self):
+        pool = DeepSeekKeyPool(["sk-aaaa1111", "sk-bbbb2222"])
+
+        first = pool.acquire()
+        pool.release(first, 429, retry_after="60")
+        picks = set()
+        for _ in range(3):
+            state = pool.acquire()
+            picks.add(state.key)
+            pool.release(state, 200, usage={"prompt_tokens": 3})
+
+        self.assertEqual(picks, {"sk-aaaa1111", "sk-bbbb2222"} - {first.key})
+        usage = {item["key"]: item for item in pool.usage()}
+        self.assertEqual(usage[first.label]["rate_limited"], 1)
+        self.assertGreater(usage[first.label]["cooldown_seconds"], 0)
+
+    def test_picks_key_with_most_headroom(self):
+        pool = DeepSeekKeyPool(
+            ["sk-aaaa1111", "sk-bbbb2222"], max_requests_per_minute=10
+        )
+
+        keys = []
+        for _ in range(4):
+            state = pool.acquire()
+            keys.append(state.key)
+            pool.release(state, 200)
+
+        self.assertEqual(keys.count("sk-aaaa1111"), 2)
+        self.assertEqual(keys.count("sk-bbbb2222"), 2)
+
+
+class DeepSeekClientTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = DeepSeekScheduler(max_concurrency=1)
+        patcher = mock.patch(
+            "common.deepseek.get_scheduler", return_value=self.scheduler
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = DeepSeekClient(api_key="sk-aaaa1111")
+        self.client.key_pool = DeepSeekKeyPool(["sk-aaaa1111", "sk-bbbb2222"])
+
+    def _response(self, status_code, headers=None):
+        response = mock.Mock(status_code=status_code, ok=status_code < 400)
+        response.headers = headers or {}
+        response.json.return_value = {
+            "choices": [{"message": {"content": "ok"}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 1},
+        }
+        return response
+
+    def _used_keys(self, post):
+        return [c.kwargs["headers"]["Authorization"] for c in post.call_args_list]
+
+    def test_rate_limited_call_retries_with_other_key(self):
+        with mock.patch.object(
+            self.client.session,
+            "post",
+            side_effect=[
+                self._response(429, {"Retry-After": "60"}),
+                self._response(200),
+            ],
+        ) as post:
+            result = self.client.chat_completion([{"role": "user", "content": "hi"}])
+
+        self.assertEqual(result["usage"]["completion_tokens"], 1)
+        first, second = self._used_keys(post)
+        self.assertNotEqual(first, second)
+        usage = {item["key"]: item for item in self.client.key_pool.usage()}
+        self.assertEqual(sum(item["rate_limited"] for item in usage.values()), 1)
+        self.assertEqual(sum(item["successes"] for item in usage.values()), 1)
+        self.assertEqual(self.scheduler.stats(), {"active": 0, "waiting": 0})
+
+    def test_waits_for_cooldown_without_holding_slot(self):
+        self.client.key_pool = DeepSeekKeyPool(["sk-aaaa1111"])
+        state = self.client.key_pool.acquire()
+        self.client.key_pool.release(state, 429, retry_after="60")
+        active_while_sleeping = []
+
+        def sleep(seconds):
+            active_while_sleeping.append(self.scheduler.stats()["active"])
+            state.cooldown_until = 0
+
+        with mock.patch("common.deepseek.time.sleep", side_effect=sleep):
+            with mock.patch.object(
+                self.client.session, "post", return_value=self._response(200)
+            ):
+                self.client.chat_completion([{"role": "user", "content": "hi"}])
+
+        self.assertEqual(active_while_sleeping, [0])
@@ -13,4 +13,6 @@ from excel_tools import views
 
 urlpatterns = [
     path("file/upload", views.upload_file, name="upload_file"),
+    path("file/estimate", views.estimate_file, name="estimate_file"),
+    path("deepseek/usage", views.deepseek_usage, name="deepseek_usage"),
 ]
@@ -1,14 +1,17 @@
 import logging
+import time
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from common.deepseek import get_key_pool, get_scheduler
 from .common import (
     validate_file_upload,
-    read_excel_file,
-    extract_product_descriptions,
+    read_product_descriptions,
     split_product_descriptions,
-    process_descriptions_with_ai,
+    process_descriptions_incrementally,
     build_excel_info,
+    scan_product_descriptions,
+    estimate_processing,
 )
 
 # Create your views here.
@@ -25,6 +28,7 @@ def upload_file(request):
     文件上传视图函数
     接收POST请求，处理文件上传
     """
+    start_time = time.perf_counter()
     try:
         logger.info("开始处理文件上传请求")
         logger.info("请求文件信息: %s", request.FILES)
@@ -48,25 +52,27 @@ def upload_file(request):
                 {"success": False, "message": error_message}, status=400
             )
 
-        # 读取Excel文件
-        excel_data = read_excel_file(uploaded_file)
-
-        # 提取产品描述
-        product_descriptions = extract_product_descriptions(excel_data)
+        # 读取文件并提取产品描述（CSV/TSV流式读取F列）
+        product_descriptions, excel_shape = read_product_descriptions(uploaded_file)
 
         # 分割产品描述
         product_descriptions_split = split_product_descriptions(product_descriptions)
 
-        # 使用AI处理产品描述
-        processed_descriptions = process_descriptions_with_ai(
+        # 使用AI处理产品描述，未变化的行复用之前的处理结果
+        processed_descriptions, recomputed_indices = process_descriptions_incrementally(
             product_descriptions_split
         )
 
         # 构建返回信息
         excel_info = build_excel_info(
-            excel_data, product_descriptions_split, processed_descriptions
+            excel_shape,
+            product_descriptions_split,
+            processed_descriptions,
+            recomputed_indices,
         )
 
+        logger.info("文件处理完成，耗时: %.3f秒", time.perf_counter() - start_time)
+
         return JsonResponse(
             {
                 "success": True,
@@ -85,3 +91,80 @@ def upload_file(request):
         return JsonResponse(
             {"success": False, "message": f"文件上传失败: {str(e)}"}, status=500
         )
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def estimate_file(request):
+    """
+    预估视图函数
+    只读取表格尺寸和F列，不调用AI，返回行数、token数、批次数和预计耗时
+    """
+    try:
+        logger.info("开始处理文件预估请求")
+
+        if "file" not in request.FILES:
+            logger.warning("请求中没有找到文件")
+            return JsonResponse(
+                {"success": False, "message": "没有找到上传的文件"}, status=400
+            )
+
+        uploaded_file = request.FILES["file"]
+        logger.info(
+            "接收到预估文件: %s, 大小: %s bytes", uploaded_file.name, uploaded_file.size
+        )
+
+        # 验证文件
+        is_valid, error_message = validate_file_upload(uploaded_file)
+        if not is_valid:
+            return JsonResponse(
+                {"success": False, "message": error_message}, status=400
+            )
+
+        batch_size = request.POST.get("batch_size")
+        if batch_size is not None:
+            if not batch_size.isdigit() or int(batch_size) < 1:
+                return JsonResponse(
+                    {"success": False, "message": "batch_size必须为正整数"},
+                    status=400,
+                )
+            batch_size = int(batch_size)
+
+        product_descriptions, excel_shape = scan_product_descriptions(uploaded_file)
+        estimate = estimate_processing(
+            product_descriptions, excel_shape, batch_size=batch_size
+        )
+
+        return JsonResponse(
+            {
+                "success": True,
+                "message": "文件预估成功",
+                "file_name": uploaded_file.name,
+                "file_size": uploaded_file.size,
+                "estimate": estimate,
+            }
+        )
+
+    except ValueError as e:
+        logger.error("文件预估失败: %s", str(e))
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+    except Exception as e:
+        logger.error("文件预估处理失败: %s", str(e), exc_info=True)
+        return JsonResponse(
+            {"success": False, "message": f"文件预估失败: {str(e)}"}, status=500
+        )
+
+
+@require_http_methods(["GET"])
+def deepseek_usage(request):
+    """
+    DeepSeek用量视图函数
+    返回每个API密钥（已脱敏）的调用次数、限流次数、token用量和调度器状态
+    """
+    return JsonResponse(
+        {
+            "success": True,
+            "keys": get_key_pool().usage(),
+            "scheduler": get_scheduler().stats(),
+        }
+    )